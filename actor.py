@@ -0,0 +1,91 @@
+"""Single-writer actors: one thread owns a piece of state, everyone else posts.
+
+A room's game state used to be shared by every connection thread, the
+scheduler and the spectator feed, all funnelling through one lock. Now only
+the room's actor thread touches it. Other threads post (function, args)
+messages to its inbox and return at once:
+
+  post(fn, *args)   always accepted (joins, leaves, clock ticks: losing one
+                    would corrupt the room)
+  offer(fn, *args)  refused when the inbox already holds max_inbox messages
+                    (client commands: a flood is dropped, not queued forever)
+
+The inbox is a deque, whose append/popleft are atomic, so posting never
+waits for the actor or for other producers. The actor takes whatever is
+queued as one batch and hands it to its handler; results go out as queued
+frames and as immutable snapshots published by the handler.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from metrics import ACTOR_WAIT, ACTOR_BATCH, ACTOR_DROPPED, metrics
+
+MAX_BATCH = 1024  # messages handled per batch; the rest waits for the next one
+
+
+class Actor:
+    def __init__(self, name, handler, max_inbox=4096):
+        self.name = name
+        self.handler = handler  # handler(batch), batch = [(fn, args), ...]; runs on the actor thread
+        self.max_inbox = max_inbox
+        self.inbox = deque()  # (fn, args, monotonic time posted)
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.dropped = 0
+
+    def post(self, fn, *args):
+        self.inbox.append((fn, args, time.monotonic()))
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def offer(self, fn, *args):
+        """post() unless the inbox is full; False when the message was dropped"""
+        if len(self.inbox) >= self.max_inbox:
+            self.dropped += 1
+            metrics.inc(ACTOR_DROPPED)
+            return False
+        self.post(fn, *args)
+        return True
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Finish what is already posted, then exit"""
+        self.running = False
+        self.wakeup.set()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            # Cleared before draining: anything posted from here on sets it again
+            self.wakeup.clear()
+            self.drain()
+            if not self.running:
+                self.drain()
+                return
+
+    def drain(self):
+        """Handle everything in the inbox; also usable synchronously when no thread runs"""
+        inbox = self.inbox
+        while inbox:
+            batch = []
+            oldest = inbox[0][2]
+            while inbox and len(batch) < MAX_BATCH:
+                fn, args, _ = inbox.popleft()
+                batch.append((fn, args))
+            ACTOR_WAIT.observe(time.monotonic() - oldest)
+            ACTOR_BATCH.observe(len(batch))
+            try:
+                self.handler(batch)
+            except Exception:
+                logging.exception(f"Actor {self.name} failed handling a batch")
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+
+from game_log import events, log_invalid
+from metrics import metrics, CONNECTIONS
+from protocol import JSON, BINARY, PING_INTERVAL, encode, join_options
+from ratelimit import flood
+from scheduler import scheduler
+
+PING = {JSON: encode({'command': 'PING'}, JSON), BINARY: encode({'command': 'PING'}, BINARY)}
+
+
+class TransportLink:
+    """Drains a connection's OutboundQueue into its asyncio transport.
+
+    Frames are only moved while the transport is below its high-water mark,
+    so a slow socket backs up in the outbox (where updates are coalesced and
+    the client is eventually evicted) instead of in an unbounded buffer.
+    """
+
+    def __init__(self, loop, transport, outbox):
+        self.loop = loop
+        self.transport = transport
+        self.outbox = outbox
+        self.loop_thread = threading.get_ident()
+        self.paused = False
+        self.flush_scheduled = False
+        outbox.on_ready = self.schedule_flush
+
+    def schedule_flush(self):
+        """Called by OutboundQueue.put; may run on connection or scheduler threads"""
+        if self.flush_scheduled:
+            return
+        self.flush_scheduled = True
+        if threading.get_ident() == self.loop_thread:
+            self.loop.call_soon(self.flush)
+        else:
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.outbox.closed:
+            self.transport.close()
+            return
+        while not self.paused and not self.transport.is_closing():
+            data = self.outbox.pop_nowait()
+            if data is None:
+                break
+            self.transport.write(data)
+
+
+class GameProtocol(asyncio.Protocol):
+    """One game connection on the event loop (JSON lines or binary frames, see protocol.py)"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.client_id = None
+        self.link = None
+        self.transport = None
+        self.room = None  # joined with the first command
+        self.decoder = None
+        self.watchdog = None
+
+    def connection_made(self, transport):
+        address = transport.get_extra_info('peername') or ('?', 0)
+        self.client_id = f"{address[0]}:{address[1]}:{int(time.time() * 1000) % 10000}"
+        transport.set_write_buffer_limits(high=64 * 1024)
+        self.transport = transport
+        self.decoder = flood.decoder(self.client_id, on_error=log_invalid)
+        self.link = TransportLink(self.engine.loop, transport, self.engine.rooms.new_outbox())
+        self.engine.connections[self.client_id] = self
+        self.watchdog = scheduler.watchdog(self.engine.ping_interval, self.ping)
+
+        events.event('connection', "New game client connected: {}", self.client_id)
+        metrics.inc(CONNECTIONS)
+
+    def pause_writing(self):
+        self.link.paused = True
+
+    def resume_writing(self):
+        self.link.paused = False
+        self.link.flush()
+
+    def ping(self):
+        """Watchdog callback (scheduler thread): the outbox hands the frame to the loop"""
+        self.link.outbox.put(PING[BINARY if self.decoder.binary else JSON], 'PING')
+
+    def data_received(self, data):
+        self.watchdog.touch()
+        self.decoder.feed(data)
+
+        for command in self.decoder.messages():
+            events.event('command', "Command from {}: {}", self.client_id, command)
+            if self.room is None:
+                self.room = self.engine.rooms.join(self.client_id, self.transport, self.link.outbox, command)
+                self.decoder.binary = join_options(command)['protocol'] == BINARY
+            self.room.handle_command(self.client_id, command)
+        if self.decoder.limiter.offender and not self.transport.is_closing():
+            events.event('flood', "Disconnecting game client {} for flooding: dropped {}",
+                         self.client_id, self.decoder.limiter.dropped)
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        events.event('connection', "Cleaning up game client {}", self.client_id)
+        self.watchdog.cancel()
+        metrics.dec(CONNECTIONS)
+        self.engine.connections.pop(self.client_id, None)
+        if self.room is not None:
+            self.engine.rooms.leave(self.room, self.client_id)
+        self.link.outbox.close()
+
+
+class AsyncGameEngine:
+    """Event-loop game port: multiplexes all game connections on one thread"""
+
+    def __init__(self, rooms, port=55555, host='0.0.0.0', backlog=1024, ping_interval=PING_INTERVAL):
+        self.rooms = rooms  # RoomManager; port=None serves only adopted (handed-off) sockets
+        self.port = port
+        self.host = host
+        self.backlog = backlog
+        self.ping_interval = ping_interval  # silence before a connection is pinged (scheduler watchdog)
+        self.connections = {}  # {client_id: GameProtocol}
+        self.loop = None
+        self.server = None
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        if self.port is not None:
+            self.server = await self.loop.create_server(
+                lambda: GameProtocol(self), self.host, self.port,
+                reuse_address=True, backlog=self.backlog)
+            print(f"🎮 Game Server (async) listening on port {self.port}")
+
+        try:
+            if self.server:
+                async with self.server:
+                    await self.server.serve_forever()
+            else:
+                await self.stopped.wait()
+        except asyncio.CancelledError:
+            pass
+
+    def adopt(self, connection, address, initial):
+        """Take over a socket accepted elsewhere (worker mode); thread-safe"""
+        while self.loop is None:
+            time.sleep(0.01)
+        self.loop.call_soon_threadsafe(
+            lambda: asyncio.ensure_future(self._adopt(connection, initial)))
+
+    async def _adopt(self, connection, initial):
+        _, protocol = await self.loop.connect_accepted_socket(lambda: GameProtocol(self), connection)
+        if initial:
+            protocol.data_received(initial)
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def stop(self):
+        if self.loop and self.server:
+            self.loop.call_soon_threadsafe(self.server.close)
+        elif self.loop:
+            self.loop.call_soon_threadsafe(self.stopped.set)
@@ -0,0 +1,361 @@
+"""Microbenchmarks for the server hot paths, with a stored baseline.
+
+    python bench.py                 run, compare with bench_baseline.json, exit 1 on regression
+    python bench.py --save          run and store the results as the new baseline
+    python bench.py -k broadcast    only benchmarks whose name contains 'broadcast'
+
+Sockets are replaced by in-memory fakes and logging is silenced, so a run
+measures only Python work and is repeatable. Each benchmark is timed with
+timeit (gc disabled), taking the best of several repeats, and is reported
+in nanoseconds per operation. A benchmark regresses when it is slower than
+the baseline by more than --threshold (default 25%). Baselines only mean
+something on the machine that recorded them, so re-save after moving.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from game_log import events
+from http_server import CombinedServer, HttpServer, TugOfWarGameServer
+from journal import MatchJournal
+from stats import StatsCache, connect, insert_match
+from protocol import BINARY, FrameDecoder, encode, encode_json
+from ratelimit import FloodPolicy
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+BENCHMARKS = {}  # {name: setup() -> (fn, operations per call)}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class FakeSocket:
+    """Stands in for a client socket: recv() replays chunks, sends are counted"""
+
+    def __init__(self, chunks=()):
+        self.chunks = list(reversed(chunks))
+        self.sent = 0
+
+    def recv(self, size):
+        return self.chunks.pop() if self.chunks else b''
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+    def send(self, data):
+        self.sent += len(data)
+        return len(data)
+
+    def settimeout(self, timeout):
+        pass
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+class DiscardWriter:
+    """Journal writer that drops the buffers handed to it"""
+
+    def submit(self, path, data):
+        pass
+
+
+def game_room(clients, tick_rate=0):
+    """Room with fake players split over both teams; outboxes never evict"""
+    room = TugOfWarGameServer(max_outbound_frames=10 ** 6, max_outbound_lag=10 ** 9, tick_rate=tick_rate)
+    for i in range(clients):
+        room.add_client(f"bench-{i}", FakeSocket(), room.new_outbox())
+    room.actor.drain()  # no actor thread here: the benchmarks call the room directly
+    return room
+
+
+# -- HTTP ---------------------------------------------------------------------
+
+@benchmark('http.response')
+def bench_response():
+    server = HttpServer()
+    body = 'x' * 512
+    headers = {'Content-type': 'text/plain', 'Cache-Control': 'no-cache'}
+    return (lambda: server.response(200, 'OK', body, headers)), 1
+
+
+@benchmark('http.proses.santai')
+def bench_proses():
+    server = HttpServer()
+    request = "GET /santai HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip\r\nUser-Agent: bench\r\n\r\n"
+    return (lambda: server.proses(request, True)), 1
+
+
+def static_server():
+    root = tempfile.mkdtemp(prefix='bench-')
+    with open(os.path.join(root, 'bench.jpg'), 'wb') as fp:
+        fp.write(os.urandom(64 * 1024))
+    server = HttpServer()
+    server.static.root = root
+    return server
+
+
+@benchmark('http.get.cache_hit')
+def bench_get_hit():
+    server = static_server()
+    headers = ['Host: localhost']
+    return (lambda: server.http_get('/bench.jpg', headers)), 1
+
+
+@benchmark('http.get.cache_miss')
+def bench_get_miss():
+    server = static_server()
+    headers = ['Host: localhost']
+
+    def miss():
+        server.static.discard('bench.jpg')
+        return server.http_get('/bench.jpg', headers)
+    return miss, 1
+
+
+@benchmark('http.get.not_modified')
+def bench_get_304():
+    server = static_server()
+    etag = server.static.get('bench.jpg').etag
+    headers = ['Host: localhost', 'If-None-Match: ' + etag]
+    return (lambda: server.http_get('/bench.jpg', headers)), 1
+
+
+@benchmark('http.get.leaderboard')
+def bench_leaderboard():
+    """/leaderboard over 1000 stored matches, served from the stats cache"""
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'stats.db')
+    db = connect(path)
+    with db:
+        for m in range(1000):
+            players = [{'player': f'p{(m + i) % 50}', 'team': 'left' if i % 2 else 'right', 'presses': i,
+                        'won': i % 2} for i in range(10)]
+            insert_match(db, {'room': 'bench', 'started': 0.0, 'duration': 60.0, 'winner': 'LEFT',
+                              'final_position': -50, 'players': players})
+    db.close()
+    server = HttpServer()
+    server.stats = StatsCache(path)
+    headers = ['Host: localhost']
+    return (lambda: server.http_get('/leaderboard', headers)), 1
+
+
+# -- Game ---------------------------------------------------------------------
+
+def broadcast_setup(clients):
+    room = game_room(clients)
+    state = room.game_state
+
+    def broadcast():
+        # A changed state each time, or the publisher skips the broadcast
+        state.bar_position = 1 - state.bar_position
+        room.broadcast_game_state()
+    return broadcast, 1
+
+
+for _n in (10, 100, 1000):
+    benchmark(f'game.broadcast.{_n}')(lambda n=_n: broadcast_setup(n))
+
+
+def press_setup(tick_rate):
+    room = game_room(10, tick_rate=tick_rate)
+    left = next(c.client_id for c in room.clients if c.team == 'left')
+    right = next(c.client_id for c in room.clients if c.team == 'right')
+
+    def presses():
+        # Net zero, so the round never ends
+        room.handle_button_press(left, 'left')
+        room.handle_button_press(right, 'right')
+    return presses, 2
+
+
+benchmark('game.press.immediate')(lambda: press_setup(0))
+benchmark('game.press.tick')(lambda: press_setup(30))
+
+
+@benchmark('game.actor.commands')
+def bench_actor_commands():
+    """100 PRESS commands posted to a room's inbox, then handled as one batch"""
+    room = game_room(10)
+    left = next(c.client_id for c in room.clients if c.team == 'left')
+    right = next(c.client_id for c in room.clients if c.team == 'right')
+    commands = [(left, {'command': 'PRESS', 'direction': 'left', 'count': 1}),
+                (right, {'command': 'PRESS', 'direction': 'right', 'count': 1})] * 50
+
+    def commands_batch():
+        for client_id, command in commands:
+            room.handle_command(client_id, command)
+        room.actor.drain()
+    return commands_batch, len(commands)
+
+
+@benchmark('journal.press')
+def bench_journal_press():
+    """One PRESS record packed into a match journal buffer (the actor's share of journaling)"""
+    match = MatchJournal(DiscardWriter(), 'bench.towj', 'bench', 0)
+    return (lambda: match.press('bench-1', 'left', 1, 0)), 1
+
+
+@benchmark('game.framing.process_game_client')
+def bench_process_game_client():
+    """Reader loop of the threaded engine: 1000 JSON commands split over odd-sized recv chunks"""
+    server = CombinedServer()
+    server.rooms.stop()  # no game clock broadcasts during the run
+    room = server.game_server
+    room.actor.thread.join()  # the inbox is drained below, on this thread
+    room.game_state.game_active = False
+    # Limits high enough that every command reaches the room, as a well-behaved client's would
+    server.flood = FloodPolicy()
+    server.flood.apply_options(limits=['press=1e9'])
+    stream = encode_json({'command': 'JOIN_GAME'}) + b''.join(
+        encode_json({'command': 'PRESS_LEFT' if i % 2 else 'PRESS_RIGHT'}) for i in range(1000))
+    chunks = [stream[i:i + 1000] for i in range(0, len(stream), 1000)]
+
+    def session():
+        server.process_game_client(FakeSocket(chunks), ('127.0.0.1', 1))
+        room.actor.drain()
+    return session, 1001
+
+
+@benchmark('protocol.decode.json')
+def bench_decode_json():
+    stream = b''.join(encode_json({'command': 'PRESS_LEFT'}) for _ in range(1000))
+
+    def decode():
+        decoder = FrameDecoder()
+        decoder.feed(stream)
+        for _ in decoder.messages():
+            pass
+    return decode, 1000
+
+
+@benchmark('protocol.decode.binary')
+def bench_decode_binary():
+    stream = encode({'command': 'PRESS_LEFT'}, BINARY) * 1000
+
+    def decode():
+        decoder = FrameDecoder(binary=True)
+        decoder.feed(stream)
+        for _ in decoder.messages():
+            pass
+    return decode, 1000
+
+
+@benchmark('protocol.decode.limited')
+def bench_decode_limited():
+    # Same stream through the per-connection rate limiter, with limits high enough to accept everything
+    stream = encode({'command': 'PRESS_LEFT'}, BINARY) * 1000
+    policy = FloodPolicy()
+    policy.apply_options(limits=['press=1e9'])
+
+    def decode():
+        decoder = policy.decoder('bench')
+        decoder.binary = True
+        decoder.feed(stream)
+        for _ in decoder.messages():
+            pass
+    return decode, 1000
+
+
+# -- Runner -------------------------------------------------------------------
+
+def measure(name, repeat):
+    fn, ops = BENCHMARKS[name]()
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number))
+    return round(best / number / ops * 1e9, 1)
+
+
+def run(names, repeat=5):
+    results = {}
+    for name in names:
+        results[name] = measure(name, repeat)
+        print(f"{name:40s} {results[name]:>12,.1f} ns/op")
+    return results
+
+
+def slower(results, baseline, threshold):
+    return [name for name, value in results.items()
+            if baseline.get(name) and value > baseline[name] * (1 + threshold)]
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks slower than baseline * (1 + threshold)"""
+    regressions = []
+    print()
+    for name, value in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:40s} {'(new)':>12s}")
+            continue
+        change = value / base - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:40s} {change:>+11.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tug of War server microbenchmarks')
+    parser.add_argument('-k', dest='pattern', default='', help='only benchmarks containing this')
+    parser.add_argument('--save', action='store_true', help='store results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Keep log formatting and console output out of the measurements
+    events.level = logging.CRITICAL
+    logging.disable(logging.CRITICAL)
+
+    names = [n for n in BENCHMARKS if args.pattern in n]
+    results = run(names, args.repeat)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fp:
+                baseline = json.load(fp)
+        baseline.update(results)
+        with open(args.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save first")
+        return
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    # A noisy neighbour can make anything look slow once: measure suspects again, keep the best
+    for attempt in range(2):
+        suspects = slower(results, baseline, args.threshold)
+        if not suspects:
+            break
+        print(f"\nRe-measuring {len(suspects)} suspect(s)...")
+        for name in suspects:
+            results[name] = min(results[name], measure(name, args.repeat * 2))
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
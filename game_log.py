@@ -0,0 +1,181 @@
+"""Non-blocking logging for the game hot path.
+
+events.event(kind, fmt, *args) only does a level / sampling / rate-limit
+check and appends to a deque; formatting and console I/O happen on a
+background writer thread. Every event kind has its own level, 1-in-N
+sampling and per-second rate limit, and counts what it suppressed so the
+writer can report the totals instead of the lines.
+"""
+import logging
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+}
+
+
+class EventType:
+    __slots__ = ('name', 'level', 'sample', 'rate', 'seen', 'emitted', 'suppressed',
+                 'window_start', 'window_count')
+
+    def __init__(self, name, level=logging.INFO, sample=1, rate=0):
+        self.name = name
+        self.level = level
+        self.sample = sample  # keep 1 in `sample` events
+        self.rate = rate  # max events per second, 0 = unlimited
+        self.seen = 0
+        self.emitted = 0
+        self.suppressed = 0
+        self.window_start = 0.0
+        self.window_count = 0
+
+
+# Per-command and per-broadcast lines are DEBUG: off unless asked for
+DEFAULT_TYPES = {
+    'command': dict(level=logging.DEBUG, rate=50),
+    'press': dict(level=logging.DEBUG, rate=50),
+    'broadcast': dict(level=logging.DEBUG, rate=20),
+    'connection': dict(level=logging.INFO, rate=20),
+    'join': dict(level=logging.INFO, rate=20),
+    'leave': dict(level=logging.INFO, rate=20),
+    'game': dict(level=logging.INFO),
+    'http': dict(level=logging.INFO, rate=20),
+    'evict': dict(level=logging.WARNING, rate=10),
+    'invalid': dict(level=logging.WARNING, rate=10),
+    'flood': dict(level=logging.WARNING, rate=10),
+    'queue': dict(level=logging.INFO),
+}
+
+
+class EventLog:
+    def __init__(self, level=logging.INFO, max_queue=10000, flush_interval=0.2,
+                 report_interval=10.0, stream=None):
+        self.level = level
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.stream = stream
+        self.queue = deque()
+        self.dropped = 0  # queue overflow, writer could not keep up
+        self.types = {name: EventType(name, **opts) for name, opts in DEFAULT_TYPES.items()}
+        self.writer = None
+        self.reported = {}  # {kind: suppressed count at last report}
+
+    def event(self, kind, fmt, *args):
+        """Record a hot-path event; never blocks and never formats on the caller's thread"""
+        et = self.types.get(kind)
+        if et is None:
+            et = self.types[kind] = EventType(kind)
+        if et.level < self.level:
+            et.suppressed += 1
+            return
+        et.seen += 1
+        if et.sample > 1 and et.seen % et.sample:
+            et.suppressed += 1
+            return
+        if et.rate:
+            now = time.monotonic()
+            if now - et.window_start >= 1.0:
+                et.window_start = now
+                et.window_count = 0
+            if et.window_count >= et.rate:
+                et.suppressed += 1
+                return
+            et.window_count += 1
+        et.emitted += 1
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.append((time.time(), kind, fmt, args))
+
+    def configure(self, kind, level=None, sample=None, rate=None):
+        et = self.types.get(kind)
+        if et is None:
+            et = self.types[kind] = EventType(kind)
+        if level is not None:
+            et.level = LEVELS.get(level, level)
+        if sample is not None:
+            et.sample = max(1, int(sample))
+        if rate is not None:
+            et.rate = max(0, int(rate))
+
+    def apply_options(self, level='INFO', limits=(), samples=()):
+        """Command line settings: limits / samples are 'kind=N' strings"""
+        self.level = LEVELS.get(level, level)
+        for spec in limits:
+            kind, _, rate = spec.partition('=')
+            self.configure(kind, rate=rate)
+        for spec in samples:
+            kind, _, sample = spec.partition('=')
+            self.configure(kind, sample=sample)
+
+    def set_level(self, level):
+        """Runtime verbosity switch, e.g. 'DEBUG' to see every press"""
+        self.level = LEVELS.get(level, level)
+        print(f"Event log level set to {logging.getLevelName(self.level)}")
+
+    def stats(self):
+        return {name: {'emitted': et.emitted, 'suppressed': et.suppressed}
+                for name, et in self.types.items()}
+
+    def start(self):
+        # is_alive() is False in a forked worker, which must start its own writer
+        if self.writer is None or not self.writer.is_alive():
+            self.writer = threading.Thread(target=self.run_writer, daemon=True)
+            self.writer.start()
+
+    def install_signal_handlers(self):
+        """SIGUSR1 -> DEBUG, SIGUSR2 -> INFO (Unix only, main thread only)"""
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda *_: self.set_level('DEBUG'))
+            signal.signal(signal.SIGUSR2, lambda *_: self.set_level('INFO'))
+
+    def run_writer(self):
+        next_report = time.monotonic() + self.report_interval
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            if time.monotonic() >= next_report:
+                next_report += self.report_interval
+                self.report_suppressed()
+
+    def flush(self):
+        lines = []
+        while self.queue:
+            ts, kind, fmt, args = self.queue.popleft()
+            try:
+                text = fmt.format(*args) if args else fmt
+            except (IndexError, KeyError, ValueError) as e:
+                text = f"{fmt!r} {args!r} ({e})"
+            lines.append(f"{time.strftime('%H:%M:%S', time.localtime(ts))} [{kind}] {text}\n")
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write(''.join(lines))
+            stream.flush()
+
+    def report_suppressed(self):
+        summary = {}
+        for name, et in self.types.items():
+            delta = et.suppressed - self.reported.get(name, 0)
+            if delta:
+                summary[name] = delta
+                self.reported[name] = et.suppressed
+        if summary or self.dropped:
+            stream = self.stream or sys.stdout
+            stream.write(f"{time.strftime('%H:%M:%S')} [log] suppressed {summary}, dropped {self.dropped}\n")
+            stream.flush()
+
+
+events = EventLog()
+
+
+def log_invalid(message):
+    """FrameDecoder on_error hook: malformed input is rate limited like any other event"""
+    events.event('invalid', '{}', message)
@@ -0,0 +1,441 @@
+"""Persistent HTTP/1.1 connections for HttpServer.
+
+One selector thread owns every HTTP socket. It reads, splits the byte stream
+into requests with RequestParser (several may arrive pipelined in one recv,
+or one request may span many), writes the responses back in request order and closes idle
+connections. A pool worker is only busy while a request is being handled,
+so idle keep-alive sockets cost a selector entry and nothing else.
+"""
+import errno
+import logging
+import os
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from game_log import events
+from http_request import HttpError, RequestParser
+from metrics import (metrics, run_tracked, POOL_SIZE, POOL_QUEUED, HTTP_REQUESTS, HTTP_CONNECTIONS,
+                     HTTP_STREAMS)
+
+MAX_PIPELINE = 16  # parsed requests waiting behind the one being handled
+MAX_BUFFERED_OUT = 65536  # don't start the next pipelined request past this
+CONTINUE = b"HTTP/1.1 100 Continue\r\n\r\n"
+MAX_STREAM_BACKLOG = 65536  # unsent stream bytes before a subscriber starts missing updates
+FILE_CHUNK = 65536  # read size when os.sendfile can't be used
+# sendfile() errors meaning "not supported for this pair of descriptors"
+SENDFILE_UNSUPPORTED = (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP)
+
+
+class FileRange:
+    """Response part sent straight from an open file, with os.sendfile where possible"""
+    __slots__ = ('fp', 'offset', 'remaining', 'last')
+
+    def __init__(self, fp, offset, count, last=True):
+        self.fp = fp
+        self.offset = offset
+        self.remaining = count
+        self.last = last  # close fp once this part is sent
+
+
+class EventChannel:
+    """Endless response body shared by many connections (Server-Sent Events).
+
+    publish() may be called from any thread. The payload is queued as-is on
+    every subscriber, so one update is encoded once however many
+    connections are watching.
+    """
+
+    def __init__(self):
+        self.subscribers = set()  # HttpConnection; changed only on the loop thread
+        self.last = None  # latest payload, sent first to new subscribers
+        self.loop = None  # set when the first connection subscribes
+
+    def publish(self, payload, replay=True):
+        if replay:
+            self.last = payload
+        loop = self.loop
+        if loop is not None:
+            loop.publish(self, payload)
+
+
+class Subscribe:
+    """Response part: once the head is out, the connection follows channel until it closes"""
+    __slots__ = ('channel',)
+
+    def __init__(self, channel):
+        self.channel = channel
+
+
+def close_files(response):
+    """Release the files of a response that will not be sent"""
+    if isinstance(response, (list, tuple)):
+        for part in response:
+            if isinstance(part, FileRange):
+                part.fp.close()
+
+
+class HttpConnection:
+    __slots__ = ('sock', 'address', 'inbuf', 'parser', 'queue', 'outbuf', 'out_offset', 'out_bytes',
+                 'served', 'busy', 'closing', 'last_request', 'last_active', 'events', 'stream')
+
+    def __init__(self, sock, address, parser):
+        self.sock = sock
+        self.address = address
+        self.inbuf = bytearray()
+        self.parser = parser
+        self.queue = deque()  # HttpRequest, or (bytes, keep_alive) for a prepared error
+        self.outbuf = deque()  # response parts waiting for the socket: bytes-like or FileRange
+        self.out_offset = 0
+        self.out_bytes = 0
+        self.served = 0  # requests parsed so far, counts against max_requests
+        self.busy = False  # a pool worker is handling a request
+        self.closing = False  # close once the queued responses are written
+        self.last_request = False  # stop parsing: the final request has been read
+        self.last_active = time.monotonic()
+        self.events = 0  # currently registered selector events
+        self.stream = None  # EventChannel this connection follows
+
+
+class HttpKeepAliveServer:
+    def __init__(self, handler, port=8080, host='0.0.0.0', workers=50, idle_timeout=15.0,
+                 max_requests=100, max_body=8 * 1024 * 1024, backlog=128):
+        # handler(request_text, keep_alive, body) -> response bytes, or a list of parts (bytes-like / FileRange);
+        # body is a file object holding the request body, or None
+        self.handler = handler
+        self.port = port
+        self.host = host
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.max_body = max_body  # larger request bodies are refused with 413 before being read
+        self.backlog = backlog
+        self.selector = selectors.DefaultSelector()
+        self.connections = set()
+        self.completed = deque()  # (connection, response, keep_alive) from pool workers
+        self.published = deque()  # (EventChannel, payload) from publishing threads
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.sendfile = hasattr(os, 'sendfile')
+        self.running = True
+
+    def serve_forever(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        listener.setblocking(False)
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ, 'accept')
+        self.selector.register(self.wake_r, selectors.EVENT_READ, 'wake')
+        print(f"🌐 HTTP Server listening on port {self.port}")
+
+        metrics.set(POOL_SIZE['http'], self.workers)
+        next_sweep = time.monotonic() + 1.0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as self.pool:
+                while self.running:
+                    for key, mask in self.selector.select(timeout=1.0):
+                        if key.data == 'accept':
+                            self.accept(listener)
+                        elif key.data == 'wake':
+                            self.finish_completed()
+                        else:
+                            conn = key.data
+                            if mask & selectors.EVENT_READ:
+                                self.on_readable(conn)
+                            if mask & selectors.EVENT_WRITE and conn.sock.fileno() >= 0:
+                                self.on_writable(conn)
+                    now = time.monotonic()
+                    if now >= next_sweep:
+                        next_sweep = now + 1.0
+                        self.close_idle(now)
+        finally:
+            for conn in list(self.connections):
+                self.close(conn)
+            self.selector.close()
+            listener.close()
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # a wakeup is already pending
+
+    def accept(self, listener):
+        while True:
+            try:
+                sock, address = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logging.error(f"Error accepting HTTP connection: {e}")
+                return
+            sock.setblocking(False)
+            conn = HttpConnection(sock, address, RequestParser(max_body=self.max_body))
+            self.connections.add(conn)
+            metrics.inc(HTTP_CONNECTIONS)
+            self.update_events(conn)
+
+    def on_readable(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if conn.stream is not None:
+            # Nothing more is read from a stream subscriber; only its EOF matters
+            if not data:
+                self.close(conn)
+            return
+        if not data:
+            if conn.busy or conn.queue or conn.outbuf:
+                # Half-closed after sending: still answer what was asked
+                conn.last_request = conn.closing = True
+                self.update_events(conn)
+            else:
+                self.close(conn)
+            return
+        conn.last_active = time.monotonic()
+        conn.inbuf += data
+        self.parse_requests(conn)
+        self.dispatch(conn)
+        self.update_events(conn)
+
+    def parse_requests(self, conn):
+        """Cut every complete request out of the input buffer; bodies are spooled as they arrive"""
+        while not conn.last_request and len(conn.queue) < MAX_PIPELINE:
+            try:
+                request = conn.parser.parse(conn.inbuf)
+            except HttpError as e:
+                self.reject(conn, e.code, e.message)
+                return
+            if request is None:
+                return
+            conn.served += 1
+            if conn.served >= self.max_requests:
+                request.keep_alive = False
+            if not request.keep_alive:
+                conn.last_request = True
+            conn.queue.append(request)
+
+    def reject(self, conn, code, message):
+        """Answer a request that cannot be framed, after the ones before it, then close"""
+        body = message.encode()
+        response = (f"HTTP/1.1 {code} {message}\r\nConnection: close\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        conn.queue.append((response, False))
+        conn.last_request = True
+        conn.inbuf.clear()
+        conn.parser.close()
+
+    def send_continue(self, conn):
+        """Interim 100 Continue for a request whose body the client holds back, once it is next in line"""
+        request = conn.parser.request
+        if (request is not None and request.expect_continue and not conn.last_request
+                and not (conn.queue or conn.busy or conn.outbuf)):
+            request.expect_continue = False
+            conn.outbuf.append(CONTINUE)
+            conn.out_bytes += len(CONTINUE)
+
+    def dispatch(self, conn):
+        """Start the next queued request; responses go out in request order"""
+        if conn.inbuf:
+            # Requests left in the buffer while the pipeline was full
+            self.parse_requests(conn)
+        while conn.queue and not conn.busy and conn.out_bytes < MAX_BUFFERED_OUT:
+            item = conn.queue.popleft()
+            if isinstance(item, tuple):
+                self.queue_response(conn, *item)
+                continue
+            conn.busy = True
+            events.event('http', "HTTP request from {}: {} {}", conn.address, item.method, item.target[:80])
+            metrics.inc(HTTP_REQUESTS)
+            metrics.inc(POOL_QUEUED['http'])
+            self.pool.submit(run_tracked, 'http', self.handle, conn, item)
+        self.send_continue(conn)
+
+    def handle(self, conn, request):
+        """Pool worker: run the handler and pass the response back to the selector thread"""
+        try:
+            response = self.handler(request.text, request.keep_alive, request.body)
+        except Exception as e:
+            logging.warning(f"Error handling HTTP request from {conn.address}: {e}")
+            response = None
+        finally:
+            if request.body is not None:
+                request.body.close()
+        self.completed.append((conn, response, request.keep_alive))
+        self.wake()
+
+    def finish_completed(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self.completed:
+            conn, response, keep_alive = self.completed.popleft()
+            conn.busy = False
+            if conn not in self.connections:
+                close_files(response)
+                continue
+            if response is None:
+                self.close(conn)
+                continue
+            self.queue_response(conn, response, keep_alive)
+            self.on_writable(conn)
+            if conn in self.connections:
+                self.dispatch(conn)
+                self.update_events(conn)
+        while self.published:
+            channel, payload = self.published.popleft()
+            for conn in list(channel.subscribers):
+                self.send_event(conn, payload)
+
+    def publish(self, channel, payload):
+        self.published.append((channel, payload))
+        self.wake()
+
+    def subscribe(self, conn, channel):
+        """The response head is out: from now on the connection only receives channel payloads"""
+        channel.loop = self
+        channel.subscribers.add(conn)
+        conn.stream = channel
+        conn.last_request = True
+        conn.inbuf.clear()
+        conn.parser.close()
+        # Requests pipelined behind the stream are never answered
+        for request in conn.queue:
+            if not isinstance(request, tuple) and request.body is not None:
+                request.body.close()
+        conn.queue.clear()
+        metrics.inc(HTTP_STREAMS)
+        if channel.last is not None:
+            conn.outbuf.append(channel.last)
+            conn.out_bytes += len(channel.last)
+
+    def send_event(self, conn, payload):
+        if conn.out_bytes > MAX_STREAM_BACKLOG:
+            # Not keeping up; it gets a later update instead
+            return
+        conn.outbuf.append(payload)
+        conn.out_bytes += len(payload)
+        self.on_writable(conn)
+
+    def queue_response(self, conn, response, keep_alive):
+        if isinstance(response, (bytes, bytearray, memoryview)):
+            response = (response,)
+        for part in response:
+            conn.outbuf.append(part)
+            if not isinstance(part, (FileRange, Subscribe)):
+                conn.out_bytes += len(part)
+        if not keep_alive:
+            # Nothing after this response will be answered
+            conn.closing = True
+            conn.queue.clear()
+
+    def on_writable(self, conn):
+        while conn.outbuf:
+            part = conn.outbuf[0]
+            if isinstance(part, Subscribe):
+                conn.outbuf.popleft()
+                self.subscribe(conn, part.channel)
+                continue
+            try:
+                if isinstance(part, FileRange):
+                    if part.remaining:
+                        self.send_file(conn, part)
+                    done = part.remaining == 0
+                else:
+                    sent = conn.sock.send(memoryview(part)[conn.out_offset:])
+                    conn.out_offset += sent
+                    conn.out_bytes -= sent
+                    done = conn.out_offset >= len(part)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close(conn)
+                return
+            conn.last_active = time.monotonic()
+            if not done:
+                break
+            conn.outbuf.popleft()
+            conn.out_offset = 0
+            if isinstance(part, FileRange) and part.last:
+                part.fp.close()
+        if conn.closing and conn.stream is None and not (conn.outbuf or conn.queue or conn.busy):
+            self.close(conn)
+            return
+        self.dispatch(conn)
+        self.update_events(conn)
+
+    def send_file(self, conn, part):
+        """Send the next piece of a FileRange; the file never passes through Python memory with sendfile"""
+        if self.sendfile:
+            try:
+                sent = os.sendfile(conn.sock.fileno(), part.fp.fileno(), part.offset, part.remaining)
+            except OSError as e:
+                if e.errno not in SENDFILE_UNSUPPORTED:
+                    raise
+                self.sendfile = False
+        if not self.sendfile:
+            data = os.pread(part.fp.fileno(), min(FILE_CHUNK, part.remaining), part.offset)
+            sent = conn.sock.send(data) if data else 0
+        if sent == 0:
+            raise OSError(f"{part.fp.name} shrank while being sent")
+        part.offset += sent
+        part.remaining -= sent
+
+    def update_events(self, conn):
+        wanted = 0
+        if conn.stream is not None or (not conn.last_request and len(conn.queue) < MAX_PIPELINE):
+            wanted |= selectors.EVENT_READ
+        if conn.outbuf:
+            wanted |= selectors.EVENT_WRITE
+        if wanted == conn.events:
+            return
+        if not conn.events:
+            self.selector.register(conn.sock, wanted, conn)
+        elif not wanted:
+            self.selector.unregister(conn.sock)
+        else:
+            self.selector.modify(conn.sock, wanted, conn)
+        conn.events = wanted
+
+    def close_idle(self, now):
+        for conn in list(self.connections):
+            if conn.stream is not None and not conn.outbuf:
+                continue  # an idle stream is fine, a stuck one is not
+            if not conn.busy and now - conn.last_active > self.idle_timeout:
+                self.close(conn)
+
+    def close(self, conn):
+        if conn not in self.connections:
+            return
+        self.connections.discard(conn)
+        metrics.dec(HTTP_CONNECTIONS)
+        conn.parser.close()
+        if conn.stream is not None:
+            conn.stream.subscribers.discard(conn)
+            metrics.dec(HTTP_STREAMS)
+        for request in conn.queue:
+            if not isinstance(request, tuple) and request.body is not None:
+                request.body.close()
+        for part in conn.outbuf:
+            if isinstance(part, FileRange):
+                part.fp.close()
+        conn.outbuf.clear()
+        if conn.events:
+            self.selector.unregister(conn.sock)
+            conn.events = 0
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,185 @@
+"""Incremental HTTP/1.1 request parser used by http_loop.
+
+RequestParser consumes a connection's input buffer as bytes arrive and
+returns each request once its body is complete. Bodies (Content-Length or
+Transfer-Encoding: chunked) are written to a SpooledTemporaryFile as they
+are read, so memory per connection stays bounded however large the upload;
+anything over spool_size goes to a temporary file on disk. Oversized or
+malformed requests raise HttpError from the head alone, before any of the
+body is read.
+"""
+import tempfile
+
+MAX_HEAD = 16384  # request line + headers
+MAX_LINE = 1024  # chunk size line, one trailer line
+
+HEAD, BODY, CHUNK_SIZE, CHUNK_DATA, CHUNK_END, TRAILERS = range(6)
+
+
+class HttpError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+class HttpRequest:
+    __slots__ = ('method', 'target', 'version', 'headers', 'text', 'keep_alive', 'body',
+                 'body_size', 'expect_continue')
+
+    def __init__(self, method, target, version, headers, text):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers  # {lowercase name: value}
+        self.text = text  # request line and headers as HttpServer.proses expects them
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = 'keep-alive' in connection
+        else:
+            self.keep_alive = 'close' not in connection
+        self.body = None  # file object positioned at the start, None without a body
+        self.body_size = 0
+        # The client waits for "100 Continue" before sending the body
+        self.expect_continue = (version != 'HTTP/1.0'
+                                and headers.get('expect', '').lower() == '100-continue')
+
+
+def parse_head(head):
+    """Request line and headers of one request, or None if malformed"""
+    lines = head.split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep:
+            return None
+        headers[name.strip().lower()] = value.strip()
+    return parts[0].upper(), parts[1], parts[2], headers
+
+
+class RequestParser:
+    def __init__(self, max_body=8 * 1024 * 1024, spool_size=65536):
+        self.max_body = max_body
+        self.spool_size = spool_size
+        self.state = HEAD
+        self.request = None  # request whose body is being read
+        self.remaining = 0  # body or chunk bytes still expected
+        self.trailer_bytes = 0
+
+    def parse(self, buffer):
+        """Consume buffer (a bytearray) up to the end of the next request.
+
+        Returns the request once it is complete, None if more data is
+        needed; raises HttpError if the request must be rejected.
+        """
+        while True:
+            if self.state == HEAD:
+                head_end = buffer.find(b'\r\n\r\n')
+                if head_end < 0:
+                    if len(buffer) > MAX_HEAD:
+                        raise HttpError(431, 'Request Header Fields Too Large')
+                    return None
+                head = bytes(buffer[:head_end]).decode('iso-8859-1')
+                del buffer[:head_end + 4]
+                self.start(head)
+                if self.state == HEAD:
+                    return self.finish()
+            elif self.state in (BODY, CHUNK_DATA):
+                if not buffer:
+                    return None
+                n = min(self.remaining, len(buffer))
+                self.request.body.write(buffer[:n])
+                self.request.body_size += n
+                del buffer[:n]
+                self.remaining -= n
+                if self.remaining:
+                    return None
+                if self.state == BODY:
+                    return self.finish()
+                self.state = CHUNK_END
+            elif self.state == CHUNK_END:
+                if len(buffer) < 2:
+                    return None
+                if buffer[:2] != b'\r\n':
+                    raise HttpError(400, 'Bad Request')
+                del buffer[:2]
+                self.state = CHUNK_SIZE
+            else:
+                line_end = buffer.find(b'\r\n')
+                if line_end < 0:
+                    if len(buffer) > MAX_LINE:
+                        raise HttpError(400, 'Bad Request')
+                    return None
+                line = bytes(buffer[:line_end])
+                del buffer[:line_end + 2]
+                if self.state == CHUNK_SIZE:
+                    self.chunk_size(line)
+                elif line:
+                    # Trailer fields are read and ignored
+                    self.trailer_bytes += len(line)
+                    if self.trailer_bytes > MAX_HEAD:
+                        raise HttpError(431, 'Request Header Fields Too Large')
+                else:
+                    return self.finish()
+
+    def start(self, head):
+        """Parse a request head and decide how its body is framed"""
+        parsed = parse_head(head)
+        if parsed is None:
+            raise HttpError(400, 'Bad Request')
+        method, target, version, headers = parsed
+        request = HttpRequest(method, target, version, headers, head + '\r\n\r\n')
+        encoding = headers.get('transfer-encoding')
+        length = headers.get('content-length')
+        if encoding is not None:
+            if length is not None:
+                # Ambiguous framing, the classic request smuggling vector
+                raise HttpError(400, 'Bad Request')
+            if encoding.lower() != 'chunked':
+                raise HttpError(501, 'Not Implemented')
+            self.state = CHUNK_SIZE
+        elif length is not None:
+            if not (length.isascii() and length.isdigit()):
+                raise HttpError(400, 'Bad Request')
+            self.remaining = int(length)
+            if self.remaining > self.max_body:
+                raise HttpError(413, 'Payload Too Large')
+            if self.remaining:
+                self.state = BODY
+        if self.state != HEAD:
+            request.body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self.request = request
+
+    def chunk_size(self, line):
+        size = line.split(b';', 1)[0].strip()
+        try:
+            size = int(size, 16)
+        except ValueError:
+            raise HttpError(400, 'Bad Request')
+        if size < 0:
+            raise HttpError(400, 'Bad Request')
+        if size == 0:
+            self.state = TRAILERS
+            self.trailer_bytes = 0
+            return
+        if self.request.body_size + size > self.max_body:
+            raise HttpError(413, 'Payload Too Large')
+        self.remaining = size
+        self.state = CHUNK_DATA
+
+    def finish(self):
+        request = self.request
+        if request.body is not None:
+            request.body.seek(0)
+        self.request = None
+        self.state = HEAD
+        return request
+
+    def close(self):
+        """Drop a partly received request"""
+        if self.request is not None and self.request.body is not None:
+            self.request.body.close()
+        self.request = None
@@ -1,14 +1,33 @@
-import sys
 import os.path
+import shutil
 import uuid
 import socket
 import threading
 import time
-import json
 import logging
-from glob import glob
-from datetime import datetime
+import argparse
+import multiprocessing
+from urllib.parse import parse_qs
 from concurrent.futures import ThreadPoolExecutor
+from actor import Actor
+from async_engine import AsyncGameEngine
+from outbound import OutboundQueue, socket_writer
+from protocol import (JSON, BINARY, DIRECTIONS, PING_INTERVAL, encode, encode_json, join_options,
+                      press_count, press_seq)
+from game_log import events, log_invalid
+from journal import journal
+from stats import stats, StatsCache
+from ratelimit import flood
+from http_loop import HttpKeepAliveServer, FileRange, Subscribe
+from static_cache import StaticCache, StaticFile, http_date, parse_range
+from metrics import (metrics, run_tracked, COMMANDS, CONNECTIONS, PLAYERS, PRESSES,
+                     GAMES_STARTED, GAMES_ENDED, BROADCASTS, BROADCAST_RECIPIENTS, BROADCAST_SECONDS,
+                     EVICTIONS, POOL_SIZE, POOL_QUEUED)
+from publisher import StatePublisher
+from scheduler import scheduler
+from registry import ClientRecord, ClientRegistry
+from rooms import DEFAULT_ROOM, RoomManager, ConnectionDispatcher, receive_handoffs
+from spectate import SpectatorFeed
 
 class GameState:
     def __init__(self):
@@ -22,139 +41,301 @@ class GameState:
         self.winner = None
 
 class TugOfWarGameServer:
-    def __init__(self):
-        self.clients = {}  # {client_id: {'socket': socket, 'team': 'left'|'right'}}
+    """One room. Its state is owned by a single actor thread (see actor.py).
+    
+    The methods called from other threads (add_client, remove_client,
+    handle_command, start_new_game and the scheduler's second/tick) only
+    post a message to the room's inbox; the underscore versions and
+    everything they call run on the actor, one message at a time, so the
+    game logic needs no lock. Other threads read the immutable snapshot
+    the actor publishes after each batch.
+    """
+    def __init__(self, room_id=DEFAULT_ROOM, max_outbound_frames=64, max_outbound_lag=5.0, tick_rate=0,
+                 max_inbox=4096, journal_dir=None, stats_db=None):
+        self.room_id = room_id
+        self.clients = ClientRegistry()
+        # Joins waiting to be assigned; flushed as one batch with one broadcast
+        self.pending_joins = []
         self.game_state = GameState()
-        self.lock = threading.Lock()
-        self.running = True
+        self.publisher = StatePublisher()
+        self.actor = Actor(f"room-{room_id}", self.apply_batch, max_inbox)
+        # Slow consumers are evicted once their outbox passes either threshold
+        self.max_outbound_frames = max_outbound_frames
+        self.max_outbound_lag = max_outbound_lag
+        self.evicted_count = 0
+        # Tick mode (tick_rate > 0): presses only bump a per-team counter and
+        # the game loop applies the net pull tick_rate times per second
+        self.tick_rate = tick_rate
+        self.presses = {'left': 0, 'right': 0}
+        self.press_acks = {}  # tick mode: {client_id: last PRESS seq}, acknowledged by the next tick
+        self.seconds_due = 0  # tick mode: game seconds waiting for the next tick
+        self.seconds = 0
+        self.timers = []  # periodic timers on the shared scheduler, see start()
+        self.restart_timer = None
+        # Match journal (see journal.py): one file per match in journal_dir, None when not recording
+        self.journal_dir = journal_dir
+        self.journal = None
+        # Match history (see stats.py): results go to the SQLite file stats_db, None when disabled
+        self.stats_db = stats_db
+        self.match_started = time.time()
+        self.match_clock = time.monotonic()
+        self.match_players = {}  # {client_id: [player, team, presses]} of everyone who played this round
+        # Immutable state in STATE_FIELDS order, replaced by the actor after every batch
+        self.snapshot = self.state_tuple()
         
-    def add_client(self, client_id, socket):
-        """Add new client and assign to team"""
-        with self.lock:
-            # Debug: Print current clients before assignment
-            print(f"Current clients before adding {client_id}:")
-            for c_id, c_info in self.clients.items():
-                print(f"  {c_id}: team={c_info.get('team')}")
-            
-            # Count players per team
-            left_count = sum(1 for c in self.clients.values() if c.get('team') == 'left')
-            right_count = sum(1 for c in self.clients.values() if c.get('team') == 'right')
-            
-            print(f"Team counts - Left: {left_count}, Right: {right_count}")
-            
-            # Assign to team with fewer players, or alternate if equal
-            if left_count < right_count:
-                team = 'left'
-            elif right_count < left_count:
-                team = 'right'
-            else:
-                # If equal, alternate based on total client count
-                total_clients = len(self.clients)
-                team = 'left' if total_clients % 2 == 0 else 'right'
-            
-            self.clients[client_id] = {
-                'socket': socket,
-                'team': team
-            }
-            
-            print(f"Client {client_id} assigned to team {team}")
+    def new_outbox(self):
+        """Create the outbound queue for a new connection"""
+        return OutboundQueue(self.max_outbound_frames, self.max_outbound_lag)
+    
+    def outbound_stats(self):
+        """Queue depth / coalescing / eviction counters across all connections"""
+        records = list(self.clients.records.values())
+        depths = [len(c.outbox) for c in records]
+        return {
+            'clients': len(depths),
+            'queued_frames': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'coalesced': sum(c.outbox.coalesced for c in records),
+            'evicted': self.evicted_count,
+            'inbox': len(self.actor.inbox),
+            'dropped_commands': self.actor.dropped
+        }
+    
+    # -- posted from other threads ---------------------------------------------
+    
+    def add_client(self, client_id, socket, outbox, protocol=JSON, deltas=False, name=None):
+        """Add new client and assign to team.
+        
+        Every join waiting in the inbox is assigned as one batch with one
+        state broadcast (see apply_batch).
+        """
+        self.actor.post(self._add_client, ClientRecord(client_id, socket, outbox, protocol, deltas, name))
+    
+    def remove_client(self, client_id):
+        """Remove client from game"""
+        self.actor.post(self._remove_client, client_id)
+    
+    def handle_command(self, client_id, command):
+        """Handle command from client; dropped (False) when the room's inbox is full"""
+        if self.actor.offer(self._handle_command, client_id, command):
+            return True
+        events.event('invalid', "Room {} inbox full, dropped command from {}", self.room_id, client_id)
+        return False
+    
+    def start_new_game(self):
+        """Start new game round"""
+        self.actor.post(self._start_new_game)
+    
+    def second(self):
+        """One second of game time, every second on the scheduler"""
+        self.actor.post(self._second)
+    
+    def tick(self):
+        """Fixed-rate simulation step, tick_rate times per second on the scheduler"""
+        self.actor.post(self._tick)
+    
+    # -- actor ------------------------------------------------------------------
+    
+    def apply_batch(self, batch):
+        """Handle a batch of inbox messages in order, then publish the new snapshot"""
+        add_client = self._add_client
+        for fn, args in batch:
+            if self.pending_joins and fn != add_client:
+                # Messages queued behind a JOIN must see the client
+                self._flush_joins()
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception(f"Room {self.room_id}: {fn.__name__}{args!r} failed")
+        if self.pending_joins:
+            self._flush_joins()
+        self.snapshot = self.state_tuple()
+    
+    def _add_client(self, record):
+        self.pending_joins.append(record)
+    
+    def _flush_joins(self):
+        """Assign teams for all queued joins and broadcast once"""
+        batch, self.pending_joins = self.pending_joins, []
+        
+        self.clients.add_batch(batch)
+        for record in batch:
+            metrics.inc(PLAYERS[record.team])
+            if self.journal is not None:
+                self.journal.join(record.client_id, record.team, self.game_state.bar_position)
+            if self.stats_db:
+                self.match_players[record.client_id] = [player_name(record), record.team, 0]
+        
+        for record in batch:
+            if record.protocol == BINARY:
+                # Last JSON line this client receives; binary frames follow
+                record.outbox.put(encode_json({'command': 'PROTOCOL_ACK', 'protocol': BINARY}))
             
             # Send team assignment
-            self.send_to_client(client_id, {
+            self.send_to_client(record.client_id, {
                 'command': 'TEAM_ASSIGNED',
-                'team': team
+                'team': record.team
             })
-            
-            # Broadcast updated game state
-            self.broadcast_game_state()
+        
+        if len(batch) == 1:
+            events.event('join', "Client {} assigned to team {}", batch[0].client_id, batch[0].team)
+        else:
+            events.event('join', "{} clients joined room {}", len(batch), self.room_id)
+        events.event('join', "Team counts - Left: {}, Right: {}", *self.clients.counts())
+        
+        # Broadcast updated game state
+        self.broadcast_game_state()
     
-    def remove_client(self, client_id):
-        """Remove client from game"""
-        with self.lock:
-            if client_id in self.clients:
-                team = self.clients[client_id]['team']
-                del self.clients[client_id]
-                print(f"Client {client_id} left from team {team}")
-                self.broadcast_game_state()
+    def _remove_client(self, client_id):
+        record = self.clients.remove(client_id)
+        if record is not None:
+            metrics.dec(PLAYERS[record.team])
+            if self.journal is not None:
+                self.journal.leave(client_id, record.team, self.game_state.bar_position)
+            record.outbox.close()
+            events.event('leave', "Client {} left from team {}", client_id, record.team)
+            self.broadcast_game_state()
     
-    def handle_command(self, client_id, command):
-        """Handle command from client"""
+    def _handle_command(self, client_id, command):
         cmd_type = command.get('command')
+        metrics.inc(COMMANDS.get(cmd_type, COMMANDS['other']))
         
-        if cmd_type == 'PRESS_LEFT':
+        if cmd_type == 'PRESS':
+            # Presses coalesced by the client: one message per direction and send interval.
+            # The count is client input: clamped here, and paced per connection before
+            # decoding by the press token bucket, which charges it press by press (ratelimit.py)
+            count = press_count(command)
+            if command.get('direction') in DIRECTIONS and count:
+                self.handle_button_press(client_id, command['direction'], count, press_seq(command))
+            else:
+                events.event('invalid', "Malformed PRESS from {}: {}", client_id, command)
+        elif cmd_type == 'PRESS_LEFT':
             self.handle_button_press(client_id, 'left')
         elif cmd_type == 'PRESS_RIGHT':
             self.handle_button_press(client_id, 'right')
         elif cmd_type == 'START_GAME':
-            self.start_new_game()
+            self._start_new_game()
         elif cmd_type == 'JOIN_GAME':
             # Handle explicit join request (optional)
-            print(f"Client {client_id} requested to join game")
+            events.event('command', "Client {} requested to join game", client_id)
         else:
-            logging.warning(f"Unknown command from {client_id}: {cmd_type}")
-    
-    def handle_button_press(self, client_id, direction):
-        """Handle button press from client"""
-        with self.lock:
-            if not self.game_state.game_active:
-                print(f"Button press ignored - game not active")
-                return
-                
-            # Get client info
-            client_info = self.clients.get(client_id)
-            if not client_info:
-                print(f"Button press from unknown client: {client_id}")
-                return
-                
-            client_team = client_info.get('team')
+            events.event('invalid', "Unknown command from {}: {}", client_id, cmd_type)
+    
+    def handle_button_press(self, client_id, direction, count=1, seq=None):
+        """Handle count button presses from client; seq (if any) is acknowledged"""
+        if self.journal is not None:
+            self.journal.press(client_id, direction, count, self.game_state.bar_position)
+        if self.tick_rate:
+            self.count_button_press(client_id, direction, count, seq)
+            return
+        
+        self.apply_button_press(client_id, direction, count)
+        if seq is not None:
+            # Every state frame queued after the ack includes this press
+            self.ack_press(client_id, seq)
+    
+    def apply_button_press(self, client_id, direction, count):
+        """Move the bar for a press"""
+        if not self.game_state.game_active:
+            events.event('press', "Button press ignored - game not active")
+            return
             
-            # Verify client team matches button direction
-            if (direction == 'left' and client_team == 'left') or \
-               (direction == 'right' and client_team == 'right'):
-                
-                # Update bar position
-                old_position = self.game_state.bar_position
-                if direction == 'left':
-                    self.game_state.bar_position -= 1
-                else:
-                    self.game_state.bar_position += 1
-                
-                # Keep bar in bounds
-                self.game_state.bar_position = max(-50, min(50, self.game_state.bar_position))
-                
-                print(f"Button press from {client_id} (team {client_team}): {old_position} -> {self.game_state.bar_position}")
-                
-                # Check win condition
-                if self.game_state.bar_position <= -50:
-                    self.end_game('LEFT')
-                elif self.game_state.bar_position >= 50:
-                    self.end_game('RIGHT')
+        # Get client info
+        client_info = self.clients.get(client_id)
+        if not client_info:
+            events.event('press', "Button press from unknown client: {}", client_id)
+            return
+            
+        client_team = client_info.team
+        
+        # Verify client team matches button direction
+        if (direction == 'left' and client_team == 'left') or \
+           (direction == 'right' and client_team == 'right'):
+            
+            # Update bar position
+            metrics.inc(PRESSES, count)
+            player = self.match_players.get(client_id)
+            if player is not None:
+                player[2] += count
+            old_position = self.game_state.bar_position
+            if direction == 'left':
+                self.game_state.bar_position -= count
             else:
-                print(f"Invalid button press: client {client_id} (team {client_team}) pressed {direction}")
-    
-    def start_new_game(self):
-        """Start new game round"""
-        with self.lock:
-            # Check if we have at least one player on each team
-            left_count = sum(1 for c in self.clients.values() if c.get('team') == 'left')
-            right_count = sum(1 for c in self.clients.values() if c.get('team') == 'right')
+                self.game_state.bar_position += count
             
-            if left_count == 0 or right_count == 0:
-                print(f"Cannot start game - need players on both teams (Left: {left_count}, Right: {right_count})")
-                self.broadcast_message({
-                    'command': 'GAME_ERROR',
-                    'message': 'Butuh pemain di kedua tim untuk memulai!'
-                })
-                return
+            # Keep bar in bounds
+            self.game_state.bar_position = max(-50, min(50, self.game_state.bar_position))
             
-            self.game_state.reset_game()
-            print(f"New game started! Teams - Left: {left_count}, Right: {right_count}")
-            self.broadcast_game_state()
+            events.event('press', "Button press from {} (team {}): {} -> {}",
+                         client_id, client_team, old_position, self.game_state.bar_position)
+            
+            # Check win condition
+            if self.game_state.bar_position <= -50:
+                self.end_game('LEFT')
+            elif self.game_state.bar_position >= 50:
+                self.end_game('RIGHT')
+        else:
+            events.event('press', "Invalid button press: client {} (team {}) pressed {}",
+                         client_id, client_team, direction)
+    
+    def count_button_press(self, client_id, direction, count=1, seq=None):
+        """Tick mode: O(1) press accounting without any output"""
+        client_info = self.clients.get(client_id)
+        if not client_info:
+            return
+        if client_info.team == direction and self.game_state.game_active:
+            self.presses[direction] += count
+            metrics.inc(PRESSES, count)
+            player = self.match_players.get(client_id)
+            if player is not None:
+                player[2] += count
+        if seq is not None:
+            # Rejected presses are acknowledged too, so the client stops predicting them
+            self.press_acks[client_id] = seq
+    
+    def ack_press(self, client_id, seq):
+        """Tell a client its presses up to seq are applied, with the resulting position"""
+        self.send_to_client(client_id, {
+            'command': 'PRESS_ACK',
+            'seq': seq,
+            'bar_position': self.game_state.bar_position
+        })
+    
+    def _start_new_game(self):
+        # Check if we have at least one player on each team
+        left_count, right_count = self.clients.counts()
+        
+        if left_count == 0 or right_count == 0:
+            events.event('game', "Cannot start game - need players on both teams (Left: {}, Right: {})",
+                         left_count, right_count)
+            self.broadcast_message({
+                'command': 'GAME_ERROR',
+                'message': 'Butuh pemain di kedua tim untuk memulai!'
+            })
+            return
+        
+        self.close_journal()  # the round being replaced, with its final position
+        self.game_state.reset_game()
+        # Presses counted for the old round (tick mode) do not carry over into the new one
+        self.presses['left'] = self.presses['right'] = 0
+        if self.journal_dir:
+            self.begin_journal()
+        if self.stats_db:
+            self.begin_match_stats()
+        metrics.inc(GAMES_STARTED)
+        events.event('game', "New game started in room {}! Teams - Left: {}, Right: {}",
+                     self.room_id, left_count, right_count)
+        self.broadcast_game_state()
     
     def end_game(self, winner):
         """End current game"""
         self.game_state.game_active = False
         self.game_state.winner = winner
+        metrics.inc(GAMES_ENDED)
+        self.close_journal(winner)
+        if self.stats_db:
+            # Written behind: the actor only queues it (see stats.py)
+            stats.submit(self.stats_db, self.match_result(winner))
         
         self.broadcast_message({
             'command': 'GAME_END',
@@ -162,113 +343,319 @@ class TugOfWarGameServer:
             'bar_position': self.game_state.bar_position
         })
         
-        print(f"Game ended! Winner: {winner}, Final position: {self.game_state.bar_position}")
+        events.event('game', "Game ended in room {}! Winner: {}, Final position: {}",
+                     self.room_id, winner, self.game_state.bar_position)
         
         # Auto-restart after 5 seconds
-        threading.Timer(5.0, self.start_new_game).start()
+        self.restart_timer = scheduler.call_later(5.0, self.start_new_game)
     
     def send_to_client(self, client_id, message):
         """Send message to specific client"""
-        try:
-            if client_id in self.clients:
-                socket_obj = self.clients[client_id]['socket']
-                msg = json.dumps(message) + '\n'
-                socket_obj.send(msg.encode())
-        except Exception as e:
-            logging.warning(f"Failed to send to {client_id}: {e}")
-            # Remove dead client
-            self.remove_client(client_id)
+        client_info = self.clients.get(client_id)
+        if client_info:
+            msg = encode(message, client_info.protocol)
+            if not client_info.outbox.put(msg, message.get('command')):
+                self.evict_client(client_info)
     
     def broadcast_message(self, message):
         """Broadcast message to all clients"""
-        msg = json.dumps(message) + '\n'
-        dead_clients = []
+        kind = message.get('command')
+        encoded = {}  # encode once per protocol in use
+        started = time.perf_counter()
         
-        for client_id, client_info in self.clients.items():
-            try:
-                client_info['socket'].send(msg.encode())
-            except Exception as e:
-                logging.warning(f"Failed to broadcast to {client_id}: {e}")
-                dead_clients.append(client_id)
+        for client_info in self.clients:
+            msg = encoded.get(client_info.protocol)
+            if msg is None:
+                msg = encoded[client_info.protocol] = encode(message, client_info.protocol)
+            if not client_info.outbox.put(msg, kind):
+                self.evict_client(client_info)
         
-        # Remove dead clients
-        for client_id in dead_clients:
-            self.remove_client(client_id)
+        self.record_fanout(started)
+    
+    def record_fanout(self, started):
+        metrics.inc(BROADCASTS)
+        metrics.inc(BROADCAST_RECIPIENTS, len(self.clients))
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+    
+    def evict_client(self, client_info):
+        """Drop a client whose outbox is closed or past the lag threshold.
+        
+        The writer shuts the socket down, so the connection's own cleanup
+        posts remove_client; nothing is removed here in the middle of a broadcast.
+        """
+        if client_info.outbox.evicted and not client_info.evicted:
+            client_info.evicted = True
+            self.evicted_count += 1
+            metrics.inc(EVICTIONS)
+            events.event('evict', "Evicting slow client {}: {} frames pending, total evicted {}",
+                         client_info.client_id, len(client_info.outbox), self.evicted_count)
+    
+    def state_tuple(self):
+        """Current state in STATE_FIELDS order (other threads read self.snapshot instead)"""
+        left_count, right_count = self.clients.counts()
+        return (
+            self.game_state.bar_position,
+            self.game_state.timer,
+            left_count,
+            right_count,
+            self.game_state.game_active,
+            self.game_state.winner
+        )
     
     def broadcast_game_state(self):
         """Broadcast current game state to all clients"""
-        left_count = sum(1 for c in self.clients.values() if c.get('team') == 'left')
-        right_count = sum(1 for c in self.clients.values() if c.get('team') == 'right')
-        
-        state_msg = {
-            'command': 'GAME_UPDATE',
-            'bar_position': self.game_state.bar_position,
-            'timer': self.game_state.timer,
-            'left_count': left_count,
-            'right_count': right_count,
-            'game_active': self.game_state.game_active,
-            'winner': self.game_state.winner
+        state = self.state_tuple()
+        version = self.publisher.publish(state)
+        if version is None:
+            return  # nothing changed since the last broadcast
+        
+        events.event('broadcast', "Broadcasting game state - Left: {}, Right: {}, Position: {}",
+                     state[2], state[3], state[0])
+        publisher = self.publisher
+        started = time.perf_counter()
+        for client_info in self.clients:
+            protocol = client_info.protocol
+            if client_info.deltas:
+                ok = client_info.outbox.put_state(
+                    version, lambda base, protocol=protocol: publisher.delta_frame(base, protocol))
+            else:
+                ok = client_info.outbox.put(publisher.full_frame(protocol), 'GAME_UPDATE')
+            if not ok:
+                self.evict_client(client_info)
+        self.record_fanout(started)
+    
+    def advance_timer(self):
+        """One second of game time"""
+        if self.game_state.game_active and self.game_state.timer > 0:
+            self.game_state.timer -= 1
+            
+            # Check time up
+            if self.game_state.timer <= 0:
+                if self.game_state.bar_position < 0:
+                    winner = 'LEFT'
+                elif self.game_state.bar_position > 0:
+                    winner = 'RIGHT'
+                else:
+                    winner = 'DRAW'
+                self.end_game(winner)
+    
+    def report_outbound(self):
+        stats = self.outbound_stats()
+        if stats['queued_frames'] or stats['evicted']:
+            events.event('queue', "Outbound queues: {}", stats)
+    
+    def start(self):
+        """Start the room's actor and schedule the game clock (and the simulation tick in tick mode)"""
+        self.actor.start()
+        if self.journal_dir:
+            # The round that starts with the room is journaled too
+            self.actor.post(self.begin_journal)
+        self.timers.append(scheduler.call_every(1.0, self.second))
+        if self.tick_rate:
+            self.timers.append(scheduler.call_every(1.0 / self.tick_rate, self.tick))
+    
+    def stop(self):
+        for timer in self.timers:
+            timer.cancel()
+        if self.restart_timer is not None:
+            self.restart_timer.cancel()
+        self.actor.post(self.close_journal)
+        self.actor.stop()
+    
+    def begin_journal(self):
+        """Start a new journal file for the match that begins now, with the current roster"""
+        self.close_journal()
+        self.journal = journal.open_match(self.journal_dir, self.room_id, self.tick_rate)
+        self.journal.roster(self.clients, self.game_state.bar_position)
+    
+    def close_journal(self, winner=None):
+        """End the current journal file; winner None means the match was cut short"""
+        if self.journal is not None:
+            self.journal.end(winner, self.game_state.bar_position)
+            self.journal = None
+    
+    def begin_match_stats(self):
+        """Start counting presses for the round that begins now, for everyone already in the room"""
+        self.match_started = time.time()
+        self.match_clock = time.monotonic()
+        self.match_players = {record.client_id: [player_name(record), record.team, 0] for record in self.clients}
+    
+    def match_result(self, winner):
+        """Finished round as stored by stats.py"""
+        # One entry per player and team, even if they reconnected during the round
+        presses = {}
+        for player, team, count in self.match_players.values():
+            presses[player, team] = presses.get((player, team), 0) + count
+        return {
+            'room': self.room_id,
+            'started': self.match_started,
+            'duration': time.monotonic() - self.match_clock,
+            'winner': winner,
+            'final_position': self.game_state.bar_position,
+            'players': [{'player': player, 'team': team, 'presses': count, 'won': int(team.upper() == winner)}
+                        for (player, team), count in presses.items()]
         }
+    
+    def _second(self):
+        if self.journal is not None:
+            self.journal.second(self.game_state.bar_position)
+        self.seconds += 1
+        if self.seconds % 10 == 0:
+            self.report_outbound()
+        
+        if self.tick_rate:
+            # Applied by the next tick, so it is still one state update per tick at most
+            self.seconds_due += 1
+            return
         
-        print(f"Broadcasting game state - Left: {left_count}, Right: {right_count}, Position: {self.game_state.bar_position}")
-        self.broadcast_message(state_msg)
+        self.advance_timer()
+        
+        # Broadcast state update every second when game is active
+        if self.game_state.game_active:
+            self.broadcast_game_state()
     
-    def game_loop(self):
-        """Main game loop - runs in separate thread"""
-        while self.running:
-            time.sleep(1)  # Update every second
+    def _tick(self):
+        """Fixed-rate simulation: apply the net pull of all presses once per tick"""
+        left, right = self.presses['left'], self.presses['right']
+        self.presses['left'] = self.presses['right'] = 0
+        acks, self.press_acks = self.press_acks, {}
+        if self.journal is not None and (left or right or self.seconds_due):
+            # Empty ticks change nothing and are not recorded
+            self.journal.tick(self.game_state.bar_position)
+        
+        changed = False
+        if self.game_state.game_active and (left or right):
+            position = self.game_state.bar_position + right - left
+            self.game_state.bar_position = max(-50, min(50, position))
+            changed = True
             
-            with self.lock:
-                if self.game_state.game_active and self.game_state.timer > 0:
-                    self.game_state.timer -= 1
-                    
-                    # Check time up
-                    if self.game_state.timer <= 0:
-                        if self.game_state.bar_position < 0:
-                            winner = 'LEFT'
-                        elif self.game_state.bar_position > 0:
-                            winner = 'RIGHT'
-                        else:
-                            winner = 'DRAW'
-                        self.end_game(winner)
-                
-                # Broadcast state update every 5 seconds when game is active
-                if self.game_state.game_active:
-                    self.broadcast_game_state()
+            # Check win condition
+            if self.game_state.bar_position <= -50:
+                self.end_game('LEFT')
+            elif self.game_state.bar_position >= 50:
+                self.end_game('RIGHT')
+        
+        while self.seconds_due:
+            self.seconds_due -= 1
+            self.advance_timer()
+            changed = True
+        
+        # Acks go out before this tick's state, which already includes those presses
+        for client_id, seq in acks.items():
+            self.ack_press(client_id, seq)
+        
+        # One state update per tick at most, only when something moved
+        if changed and self.game_state.game_active:
+            self.broadcast_game_state()
 
 class HttpServer:
-    def __init__(self):
+    def __init__(self, cache_budget=32 * 1024 * 1024):
         self.sessions = {}
         self.types = {}
         self.types['.pdf'] = 'application/pdf'
         self.types['.jpg'] = 'image/jpeg'
         self.types['.txt'] = 'text/plain'
         self.types['.html'] = 'text/html'
+        # File bodies and their headers, revalidated by mtime/size (see static_cache.py)
+        self.static = StaticCache('./', self.types, budget=cache_budget)
+        # Fixed pages, served (and compressed) like cached files
+        self.pages = {
+            '/': StaticFile.from_bytes('/', 'Ini Adalah web Server percobaan'.encode(), 'text/plain'),
+            '/santai': StaticFile.from_bytes('/santai', 'santai saja'.encode(), 'text/plain'),
+        }
+        # POST /upload disimpan di sini (tidak ikut dilayani sebagai file statis)
+        self.upload_dir = './uploads'
+        # SpectatorFeed for /state and /events, set by CombinedServer (None: not available)
+        self.spectators = None
+        # StatsCache for /leaderboard and /matches, set by CombinedServer (None: --stats-db not given)
+        self.stats = None
+        # Connection header of the request being handled on this thread (set by proses)
+        self.local = threading.local()
+        
+    def response_head(self, kode, message):
+        """Status line plus the headers every response carries, as bytes"""
+        connection = 'keep-alive' if getattr(self.local, 'keep_alive', False) else 'close'
+        return ("HTTP/1.1 {} {}\r\nDate: {}\r\nConnection: {}\r\nServer: myserver/1.0\r\n"
+                .format(kode, message, http_date(), connection).encode())
         
     def response(self, kode=404, message='Not Found', messagebody=bytes(), headers={}):
-        tanggal = datetime.now().strftime('%c')
+        # message body harus diubah dulu menjadi bytes
+        if (type(messagebody) is not bytes):
+            messagebody = messagebody.encode()
         resp = []
-        resp.append("HTTP/1.0 {} {}\r\n".format(kode, message))
-        resp.append("Date: {}\r\n".format(tanggal))
-        resp.append("Connection: close\r\n")
-        resp.append("Server: myserver/1.0\r\n")
         resp.append("Content-Length: {}\r\n".format(len(messagebody)))
         for kk in headers:
             resp.append("{}:{}\r\n".format(kk, headers[kk]))
         resp.append("\r\n")
-        response_headers = ''
-        for i in resp:
-            response_headers = "{}{}".format(response_headers, i)
         # menggabungkan resp menjadi satu string dan menggabungkan dengan messagebody yang berupa bytes
         # response harus berupa bytes
-        # message body harus diubah dulu menjadi bytes
-        if (type(messagebody) is not bytes):
-            messagebody = messagebody.encode()
-        response = response_headers.encode() + messagebody
+        response = self.response_head(kode, message) + ''.join(resp).encode() + messagebody
         # response adalah bytes
         return response
         
-    def proses(self, data):
+    def static_response(self, entry, headers):
+        """Response for a static file, as a list of parts for HttpKeepAliveServer.
+
+        Cached bodies are sent from memory without copying, bigger files
+        straight from disk (FileRange / os.sendfile). Picks a precompressed
+        variant from Accept-Encoding, and supports conditional GET (304) and
+        Range requests (206, multipart/byteranges, 416) on the original.
+        """
+        variant = None
+        if 'range' not in headers:
+            variant = entry.negotiate(headers.get('accept-encoding'))
+        if entry.not_modified(headers.get('if-none-match'), headers.get('if-modified-since'),
+                              variant.etag if variant else None):
+            return self.response_head(304, 'Not Modified') + (variant or entry).validators + b'\r\n'
+        if variant is not None:
+            return [self.response_head(200, 'OK') + variant.headers + b'\r\n', variant.body]
+        fp = None
+        if entry.body is None:
+            try:
+                fp, entry = self.static.open(entry)
+            except OSError:
+                return self.response(404, 'Not Found', '', {})
+        ranges = None
+        if 'range' in headers and entry.if_range(headers.get('if-range')):
+            ranges = parse_range(headers['range'], entry.size)
+        if ranges == []:
+            if fp is not None:
+                fp.close()
+            return self.response(416, 'Range Not Satisfiable', '', {'Content-Range': 'bytes */{}'.format(entry.size)})
+        
+        def part(first, last, final=True):
+            if fp is None:
+                return memoryview(entry.body)[first:last + 1]
+            return FileRange(fp, first, last + 1 - first, final)
+        
+        if not ranges:
+            return [self.response_head(200, 'OK') + entry.headers + b'\r\n', part(0, entry.size - 1)]
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            head = ("Content-type: {}\r\nContent-Range: bytes {}-{}/{}\r\nContent-Length: {}\r\n"
+                    .format(entry.content_type, first, last, entry.size, last + 1 - first))
+            return [self.response_head(206, 'Partial Content') + head.encode() + entry.validators + b'\r\n',
+                    part(first, last)]
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for i, (first, last) in enumerate(ranges):
+            delimiter = ("\r\n--{}\r\nContent-type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n"
+                         .format(boundary, entry.content_type, first, last, entry.size).encode())
+            parts.append(delimiter)
+            parts.append(part(first, last, final=i == len(ranges) - 1))
+            length += len(delimiter) + last + 1 - first
+        closing = "\r\n--{}--\r\n".format(boundary).encode()
+        parts.append(closing)
+        length += len(closing)
+        head = ("Content-type: multipart/byteranges; boundary={}\r\nContent-Length: {}\r\n"
+                .format(boundary, length))
+        return [self.response_head(206, 'Partial Content') + head.encode() + entry.validators + b'\r\n'] + parts
+        
+    def proses(self, data, keep_alive=False, body=None):
+        # keep_alive: the connection stays open after this response (decided by HttpKeepAliveServer)
+        # body: file object berisi body request (sudah lengkap), None jika tidak ada body
+        self.local.keep_alive = keep_alive
         requests = data.split("\r\n")
         # print(requests)
         baris = requests[0]
@@ -282,138 +669,196 @@ class HttpServer:
                 return self.http_get(object_address, all_headers)
             if (method == 'POST'):
                 object_address = j[1].strip()
-                return self.http_post(object_address, all_headers)
+                return self.http_post(object_address, all_headers, body)
             else:
                 return self.response(400, 'Bad Request', '', {})
         except IndexError:
             return self.response(400, 'Bad Request', '', {})
             
     def http_get(self, object_address, headers):
-        files = glob('./*')
-        # print(files)
-        thedir = './'
-        if (object_address == '/'):
-            return self.response(200, 'OK', 'Ini Adalah web Server percobaan', dict())
+        if (object_address in self.pages):
+            return self.static_response(self.pages[object_address], parse_headers(headers))
         if (object_address == '/video'):
             return self.response(302, 'Found', '', dict(location='https://youtu.be/katoxpnTf04'))
-        if (object_address == '/santai'):
-            return self.response(200, 'OK', 'santai saja', dict())
-        object_address = object_address[1:]
-        if thedir + object_address not in files:
+        path, _, query = object_address.partition('?')
+        if (path == '/state' or path == '/events'):
+            return self.spectate(path, parse_qs(query).get('room', [DEFAULT_ROOM])[0])
+        if (path == '/leaderboard' or path == '/matches'):
+            return self.match_stats(path)
+        if (object_address == '/metrics'):
+            return self.response(200, 'OK', metrics.render(), {'Content-type': 'text/plain; version=0.0.4'})
+        entry = self.static.get(object_address[1:])
+        if entry is None:
             return self.response(404, 'Not Found', '', {})
-        fp = open(thedir + object_address, 'rb')  # rb => artinya adalah read dalam bentuk binary
-        # harus membaca dalam bentuk byte dan BINARY
-        isi = fp.read()
+        return self.static_response(entry, parse_headers(headers))
         
-        fext = os.path.splitext(thedir + object_address)[1]
-        content_type = self.types[fext]
+    def spectate(self, path, room_id):
+        """Penonton: /state (snapshot JSON) atau /events (Server-Sent Events), tanpa ikut jadi pemain"""
+        if self.spectators is None:
+            return self.response(503, 'Service Unavailable', 'spectating needs a single game process', {})
+        if path == '/state':
+            data = self.spectators.snapshot(room_id)
+            if data is None:
+                return self.response(404, 'Not Found', 'no such room', {})
+            return self.response(200, 'OK', data, {'Content-type': 'application/json', 'Cache-Control': 'no-cache'})
+        channel = self.spectators.channel(room_id)
+        if channel is None:
+            return self.response(404, 'Not Found', 'no such room', {})
+        # The stream ends when the connection does
+        self.local.keep_alive = False
+        head = self.response_head(200, 'OK') + b"Content-type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n"
+        return [head, Subscribe(channel)]
         
-        headers = {}
-        headers['Content-type'] = content_type
+    def match_stats(self, path):
+        """Riwayat pertandingan: /leaderboard dan /matches, dari cache (bukan query per request)"""
+        if self.stats is None:
+            return self.response(503, 'Service Unavailable', 'match stats need --stats-db', {})
+        return self.response(200, 'OK', self.stats.page(path),
+                             {'Content-type': 'application/json', 'Cache-Control': 'no-cache'})
         
-        return self.response(200, 'OK', isi, headers)
+    def http_post(self, object_address, headers, body=None):
+        if body is None:
+            isi = "kosong"
+            return self.response(200, 'OK', isi, {})
+        if (object_address == '/upload'):
+            return self.save_upload(parse_headers(headers), body)
+        # body lain hanya dihitung ukurannya
+        size = body.seek(0, os.SEEK_END)
+        return self.response(200, 'OK', 'diterima {} byte'.format(size), {})
         
-    def http_post(self, object_address, headers):
-        headers = {}
-        isi = "kosong"
-        return self.response(200, 'OK', isi, headers)
+    def save_upload(self, headers, body):
+        """Simpan body ke folder uploads/, nama file dari header X-Filename.
+
+        Body disalin per 64 KB dari file sementara, jadi upload besar tidak pernah utuh di memori.
+        """
+        name = os.path.basename(headers.get('x-filename', '').replace('\\', '/')).lstrip('.')
+        os.makedirs(self.upload_dir, exist_ok=True)
+        try:
+            out = open(os.path.join(self.upload_dir, name or uuid.uuid4().hex), 'xb')
+        except FileExistsError:
+            name = '{}-{}'.format(uuid.uuid4().hex[:8], name)
+            out = open(os.path.join(self.upload_dir, name), 'xb')
+        with out:
+            shutil.copyfileobj(body, out, 65536)
+            size = out.tell()
+        return self.response(201, 'Created', 'tersimpan {} ({} byte)'.format(os.path.basename(out.name), size), {})
+
+def player_name(record):
+    """Name a player is counted under in match stats: the JOIN_GAME name, else the client's address"""
+    return record.name or record.client_id.rsplit(':', 2)[0]
+
+def parse_headers(lines):
+    """['Name: value', ...] as {lowercase name: value}"""
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
 
 class CombinedServer:
     """Combined HTTP and Game Server"""
     
-    def __init__(self, http_port=8080, game_port=55555):
+    def __init__(self, http_port=8080, game_port=55555, engine='threaded', workers=1,
+                 http_idle_timeout=15.0, http_max_requests=100, http_cache_mb=32, http_max_body_mb=8,
+                 spectator_rate=2.0, **game_options):
         self.http_port = http_port
+        self.http_idle_timeout = http_idle_timeout  # close keep-alive connections idle this long
+        self.http_max_requests = http_max_requests  # requests per connection before it is closed
+        self.http_max_body = http_max_body_mb * 1024 * 1024  # bigger request bodies get 413
+        self.spectator_rate = spectator_rate  # /events updates per second
         self.game_port = game_port
-        self.http_server = HttpServer()
-        self.game_server = TugOfWarGameServer()
+        self.engine = engine  # 'threaded' | 'async'
+        self.workers = workers  # >1: rooms are sharded across worker processes
+        self.game_options = game_options  # forwarded to every TugOfWarGameServer
+        self.http_server = HttpServer(cache_budget=http_cache_mb * 1024 * 1024)
+        self.rooms = RoomManager(lambda room_id: TugOfWarGameServer(room_id, **game_options))
+        self.game_server = self.rooms.get(DEFAULT_ROOM)
+        if game_options.get('stats_db'):
+            self.http_server.stats = StatsCache(game_options['stats_db'])
+            stats.on_commit = self.http_server.stats.invalidate
+        self.async_engine = None
+        self.http_loop = None
+        self.spectators = None
+        self.worker_processes = []
+        self.log_options = {}  # game_log settings, re-applied in worker processes
+        self.limit_options = {}  # ratelimit settings, likewise
+        self.flood = flood  # FloodPolicy giving each game connection its rate-limited decoder
         self.running = True
         
-    def process_game_client(self, connection, address):
+    def process_game_client(self, connection, address, initial=b""):
         """Handle game client connection"""
         client_id = f"{address[0]}:{address[1]}:{int(time.time() * 1000) % 10000}"
         
-        print(f"New game client connected: {client_id}")
+        events.event('connection', "New game client connected: {}", client_id)
+        metrics.inc(CONNECTIONS)
+        
+        # Outbound frames are drained by a dedicated writer so broadcasts never block on this socket
+        outbox = self.rooms.new_outbox()
+        threading.Thread(target=socket_writer, args=(connection, outbox), daemon=True).start()
         
-        # Register client to game
-        self.game_server.add_client(client_id, connection)
+        # The client joins a room with its first command (JOIN_GAME may name the room)
+        room = None
         
-        rcv = ""
+        # Per-connection token buckets: a flood is dropped before it is decoded
+        decoder = self.flood.decoder(client_id, on_error=log_invalid)
+        
+        def ping():
+            # Quiet for PING_INTERVAL: check the client is still alive
+            ping_msg = encode({'command': 'PING'}, BINARY if decoder.binary else JSON)
+            if not outbox.put(ping_msg, 'PING'):
+                events.event('connection', "Game client {} ping failed - disconnecting", client_id)
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)  # wakes the blocked recv below
+                except OSError:
+                    pass
+        
+        # Liveness comes from a scheduler watchdog instead of a timeout on every recv
+        watchdog = scheduler.watchdog(PING_INTERVAL, ping)
+        data = initial
         try:
             while self.running:
                 try:
-                    # Set socket timeout to detect disconnections
-                    connection.settimeout(30.0)
-                    data = connection.recv(1024)
+                    if not data:
+                        data = connection.recv(1024)
                     
                     if data:
-                        # Decode bytes to string
-                        d = data.decode()
-                        rcv = rcv + d
+                        watchdog.touch()
+                        decoder.feed(data)
+                        data = b""
                         
-                        # Process complete messages (ended with \n)
-                        while '\n' in rcv:
-                            line, rcv = rcv.split('\n', 1)
-                            if line.strip():
-                                # Process game command
-                                try:
-                                    command = json.loads(line.strip())
-                                    print(f"Command from {client_id}: {command}")
-                                    self.game_server.handle_command(client_id, command)
-                                except json.JSONDecodeError as e:
-                                    logging.warning(f"Invalid JSON from {client_id}: {line} | Error: {e}")
+                        # Process complete messages (JSON lines, or binary frames after JOIN_GAME)
+                        for command in decoder.messages():
+                            events.event('command', "Command from {}: {}", client_id, command)
+                            if room is None:
+                                room = self.rooms.join(client_id, connection, outbox, command)
+                                decoder.binary = join_options(command)['protocol'] == BINARY
+                            room.handle_command(client_id, command)
+                        if decoder.limiter.offender:
+                            events.event('flood', "Disconnecting game client {} for flooding: dropped {}",
+                                         client_id, decoder.limiter.dropped)
+                            break
                     else:
                         # Client disconnected
-                        print(f"Game client {client_id} disconnected (no data)")
-                        break
-                        
-                except socket.timeout:
-                    # Send ping to check if client is still alive
-                    try:
-                        ping_msg = json.dumps({'command': 'PING'}) + '\n'
-                        connection.send(ping_msg.encode())
-                    except:
-                        print(f"Game client {client_id} ping failed - disconnecting")
+                        events.event('connection', "Game client {} disconnected (no data)", client_id)
                         break
                         
                 except OSError as e:
-                    print(f"OSError from game client {client_id}: {e}")
+                    events.event('connection', "OSError from game client {}: {}", client_id, e)
                     break
                 except Exception as e:
-                    print(f"Unexpected error from game client {client_id}: {e}")
+                    events.event('connection', "Unexpected error from game client {}: {}", client_id, e)
                     break
                     
         except Exception as e:
             logging.warning(f"Error handling game client {client_id}: {e}")
         finally:
             # Remove client from game
-            print(f"Cleaning up game client {client_id}")
-            self.game_server.remove_client(client_id)
-            try:
-                connection.close()
-            except:
-                pass
-    
-    def process_http_client(self, connection, address):
-        """Handle HTTP client connection"""
-        try:
-            # Set timeout for HTTP requests
-            connection.settimeout(10.0)
-            
-            # Receive HTTP request
-            request_data = connection.recv(4096).decode()
-            
-            if request_data:
-                print(f"HTTP request from {address}: {request_data.split()[0:3] if len(request_data.split()) >= 3 else request_data[:50]}")
-                
-                # Process HTTP request
-                response = self.http_server.proses(request_data)
-                
-                # Send HTTP response
-                connection.send(response)
-            
-        except Exception as e:
-            logging.warning(f"Error handling HTTP client {address}: {e}")
-        finally:
+            watchdog.cancel()
+            events.event('connection', "Cleaning up game client {}", client_id)
+            metrics.dec(CONNECTIONS)
+            if room is not None:
+                self.rooms.leave(room, client_id)
+            outbox.close()
             try:
                 connection.close()
             except:
@@ -430,12 +875,14 @@ class CombinedServer:
             
             print(f"🎮 Game Server listening on port {self.game_port}")
             
+            metrics.set(POOL_SIZE['game'], 50)
             with ThreadPoolExecutor(max_workers=50) as executor:
                 while self.running:
                     try:
                         connection, client_address = game_socket.accept()
                         # Submit game client handler to thread pool
-                        executor.submit(self.process_game_client, connection, client_address)
+                        metrics.inc(POOL_QUEUED['game'])
+                        executor.submit(run_tracked, 'game', self.process_game_client, connection, client_address)
                         
                     except Exception as e:
                         if self.running:
@@ -447,31 +894,20 @@ class CombinedServer:
             game_socket.close()
     
     def start_http_server(self):
-        """Start the HTTP server"""
-        http_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        http_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+        """Start the HTTP server (persistent connections, see http_loop.py)"""
+        self.http_loop = HttpKeepAliveServer(self.http_server.proses, port=self.http_port,
+                                             idle_timeout=self.http_idle_timeout,
+                                             max_requests=self.http_max_requests,
+                                             max_body=self.http_max_body)
+        if self.workers == 1:
+            # With worker processes the rooms live elsewhere and cannot be watched from here
+            self.spectators = SpectatorFeed(self.rooms, rate=self.spectator_rate)
+            self.http_server.spectators = self.spectators
+            self.spectators.start()
         try:
-            http_socket.bind(('0.0.0.0', self.http_port))
-            http_socket.listen(20)
-            
-            print(f"🌐 HTTP Server listening on port {self.http_port}")
-            
-            with ThreadPoolExecutor(max_workers=50) as executor:
-                while self.running:
-                    try:
-                        connection, client_address = http_socket.accept()
-                        # Submit HTTP client handler to thread pool
-                        executor.submit(self.process_http_client, connection, client_address)
-                        
-                    except Exception as e:
-                        if self.running:
-                            logging.error(f"Error accepting HTTP connection: {e}")
-                        
+            self.http_loop.serve_forever()
         except Exception as e:
             logging.error(f"HTTP server error: {e}")
-        finally:
-            http_socket.close()
     
     def start(self):
         """Start both servers"""
@@ -479,35 +915,165 @@ class CombinedServer:
         print("🚀 COMBINED HTTP & GAME SERVER STARTING")
         print("="*60)
         print(f"🌐 HTTP Server: http://localhost:{self.http_port}")
-        print(f"🎮 Game Server: localhost:{self.game_port}")
+        print(f"🎮 Game Server: localhost:{self.game_port} ({self.engine} engine)")
         print("="*60)
         
-        # Start game timer thread
-        game_timer_thread = threading.Thread(target=self.game_server.game_loop, daemon=True)
-        game_timer_thread.start()
+        events.start()
+        events.install_signal_handlers()
+        
+        # Every room's game clock runs on the shared scheduler (see RoomManager, scheduler.py)
         
         # Start HTTP server in separate thread
         http_thread = threading.Thread(target=self.start_http_server, daemon=True)
         http_thread.start()
         
         # Start game server in main thread
-        self.start_game_server()
+        if self.workers > 1:
+            self.start_game_workers()
+        elif self.engine == 'async':
+            self.async_engine = AsyncGameEngine(self.rooms, port=self.game_port)
+            self.async_engine.serve_forever()
+        else:
+            self.start_game_server()
+    
+    def start_game_workers(self):
+        """Shard rooms across worker processes; this process only routes connections"""
+        ctx = multiprocessing.get_context()
+        # Rooms live in the workers; this process only routes connections and serves HTTP
+        self.rooms.close()
+        # Segment 0 is this process (HTTP + dispatcher), segment i+1 is worker i
+        shared_metrics = metrics.share(self.workers + 1)
+        channels = []
+        for i in range(self.workers):
+            parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            process = ctx.Process(target=run_game_worker, daemon=True,
+                                  args=(child_end, self.engine, self.game_options, self.log_options,
+                                        self.limit_options, shared_metrics, i + 1))
+            process.start()
+            child_end.close()
+            channels.append(parent_end)
+            self.worker_processes.append(process)
+        
+        self.dispatcher = ConnectionDispatcher(channels, port=self.game_port)
+        self.dispatcher.serve_forever()
+    
+    def serve_worker(self, channel):
+        """Worker process: serve the connections handed over by the dispatcher"""
+        print(f"🎮 Game worker {os.getpid()} ready ({self.engine} engine)")
+        if self.engine == 'async':
+            self.async_engine = AsyncGameEngine(self.rooms, port=None)
+            threading.Thread(target=receive_handoffs, args=(channel, self.async_engine.adopt),
+                             daemon=True).start()
+            self.async_engine.serve_forever()
+        else:
+            metrics.set(POOL_SIZE['game'], 50)
+            with ThreadPoolExecutor(max_workers=50) as executor:
+                def submit(connection, address, initial):
+                    metrics.inc(POOL_QUEUED['game'])
+                    executor.submit(run_tracked, 'game', self.process_game_client, connection, address, initial)
+                receive_handoffs(channel, submit)
     
     def stop(self):
         """Stop both servers"""
         print("🛑 Stopping servers...")
         self.running = False
-        self.game_server.running = False
+        self.rooms.stop()
+        journal.close()
+        stats.close()
+        if self.async_engine:
+            self.async_engine.stop()
+        if self.http_loop:
+            self.http_loop.stop()
+        if self.spectators:
+            self.spectators.stop()
+        for process in self.worker_processes:
+            process.terminate()
+
+def run_game_worker(channel, engine, game_options, log_options, limit_options, shared_metrics, segment):
+    """Entry point of a game worker process"""
+    metrics.attach(shared_metrics, segment)
+    events.apply_options(**log_options)
+    flood.apply_options(**limit_options)
+    events.start()
+    server = CombinedServer(engine=engine, **game_options)
+    try:
+        server.serve_worker(channel)
+    except KeyboardInterrupt:
+        server.stop()
 
 def main():
+    parser = argparse.ArgumentParser(description='Tug of War HTTP & Game Server')
+    parser.add_argument('--engine', choices=['threaded', 'async'], default='threaded',
+                        help='threaded: thread per game connection, async: single event loop')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='game worker processes; rooms are distributed across them')
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--game-port', type=int, default=55555)
+    parser.add_argument('--http-idle-timeout', type=float, default=15.0,
+                        help='close keep-alive HTTP connections idle for this many seconds')
+    parser.add_argument('--http-max-requests', type=int, default=100,
+                        help='requests served on one HTTP connection before it is closed')
+    parser.add_argument('--http-cache-mb', type=int, default=32,
+                        help='memory budget for cached static files (MB)')
+    parser.add_argument('--http-max-body-mb', type=int, default=8,
+                        help='largest accepted request body (MB); larger ones are refused with 413')
+    parser.add_argument('--spectator-rate', type=float, default=2.0,
+                        help='state updates per second sent to /events spectators')
+    parser.add_argument('--tick-rate', type=int, default=0,
+                        help='simulation ticks per second (e.g. 20-60); 0 applies every press immediately')
+    parser.add_argument('--max-outbound-frames', type=int, default=64,
+                        help='evict a client once this many frames are waiting to be sent')
+    parser.add_argument('--max-outbound-lag', type=float, default=5.0,
+                        help='evict a client whose oldest pending frame is older than this (seconds)')
+    parser.add_argument('--journal-dir', default=None,
+                        help='record every match to a binary journal file in this directory (see replay.py)')
+    parser.add_argument('--stats-db', default=None,
+                        help='store match results in this SQLite file and serve /leaderboard and /matches')
+    parser.add_argument('--max-inbox', type=int, default=4096,
+                        help='client commands waiting for a room before further ones are dropped')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='CLASS=RATE[/BURST]',
+                        help='per second one connection may send, per class (press: presses, start and other: '
+                             'messages), e.g. press=30/30')
+    parser.add_argument('--flood-disconnect', type=int, default=300,
+                        help='disconnect a client after this many rate-limited messages within 10 s (0 = never)')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help='event log level (SIGUSR1 switches to DEBUG, SIGUSR2 back to INFO at runtime)')
+    parser.add_argument('--log-limit', action='append', default=[], metavar='KIND=N',
+                        help='max lines per second for an event kind, e.g. press=10')
+    parser.add_argument('--log-sample', action='append', default=[], metavar='KIND=N',
+                        help='log only 1 in N events of a kind, e.g. command=100')
+    args = parser.parse_args()
+
     # Setup logging
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
     
+    log_options = {'level': args.log_level, 'limits': args.log_limit, 'samples': args.log_sample}
+    events.apply_options(**log_options)
+    limit_options = {'limits': args.rate_limit, 'disconnect_after': args.flood_disconnect}
+    try:
+        flood.apply_options(**limit_options)
+    except ValueError as e:
+        parser.error(f"--rate-limit: {e}")
+    
     # Create combined server
-    server = CombinedServer(http_port=8080, game_port=55555)
+    server = CombinedServer(http_port=args.http_port, game_port=args.game_port, engine=args.engine,
+                            workers=args.workers,
+                            http_idle_timeout=args.http_idle_timeout,
+                            http_max_requests=args.http_max_requests,
+                            http_cache_mb=args.http_cache_mb,
+                            http_max_body_mb=args.http_max_body_mb,
+                            spectator_rate=args.spectator_rate,
+                            max_outbound_frames=args.max_outbound_frames,
+                            max_outbound_lag=args.max_outbound_lag,
+                            tick_rate=args.tick_rate,
+                            max_inbox=args.max_inbox,
+                            journal_dir=args.journal_dir,
+                            stats_db=args.stats_db)
+    server.log_options = log_options
+    server.limit_options = limit_options
     
     try:
         server.start()
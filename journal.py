@@ -0,0 +1,195 @@
+"""Append-only binary journal of every match, one file per match.
+
+A room with a journal directory (--journal-dir) records what happens to its
+game state: the roster when the match starts, joins, leaves, presses, game
+seconds, simulation ticks and the result. Each record is a fixed RECORD
+struct after a small header, so a file can be read back with mmap and
+struct.iter_unpack without parsing:
+
+  t_ms      milliseconds since the match started (monotonic clock)
+  kind      ROSTER, JOIN, LEAVE, PRESS, SECOND, TICK or END
+  team      -1 left / +1 right (END: winner code, see WINNERS)
+  count     presses in a PRESS record
+  client    client number within the match (ids are not stored)
+  position  bar position when the record was written (before a press is applied)
+
+Records are packed into a buffer by the room's actor; the buffer is handed
+to the journal writer thread once a second or when it grows past
+FLUSH_BYTES, so the actor never touches the disk. The file is closed when
+the match ends or a new one starts.
+
+Matches are replayed with replay.py; loadtest.py --journal reuses their
+press timing.
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+
+from writebehind import WriteBehind
+
+MAGIC = b'TOWJ'
+VERSION = 1
+HEADER = struct.Struct('<4sBHdB')  # magic, version, tick rate, wall-clock start, room id length (id follows)
+RECORD = struct.Struct('<IBbHIh')
+
+ROSTER, JOIN, LEAVE, PRESS, SECOND, TICK, END = range(1, 8)
+KINDS = {ROSTER: 'roster', JOIN: 'join', LEAVE: 'leave', PRESS: 'press', SECOND: 'second', TICK: 'tick',
+         END: 'end'}
+TEAMS = {'left': -1, 'right': 1}
+WINNERS = {None: 0, 'LEFT': 1, 'RIGHT': 2, 'DRAW': 3}  # None: interrupted by a restart
+FLUSH_BYTES = 64 * 1024
+
+
+class MatchJournal:
+    """Records of one match; only used by the room's actor"""
+
+    def __init__(self, writer, path, room_id, tick_rate):
+        self.writer = writer
+        self.path = path
+        self.started = time.monotonic()
+        self.numbers = {}  # {client_id: client number}
+        room = room_id.encode()[:255]
+        self.buffer = bytearray(HEADER.pack(MAGIC, VERSION, tick_rate, time.time(), len(room)) + room)
+
+    def record(self, kind, position, team=0, count=0, client=0):
+        t_ms = int((time.monotonic() - self.started) * 1000)
+        self.buffer += RECORD.pack(t_ms, kind, team, count, client, position)
+        if len(self.buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    def client(self, client_id):
+        number = self.numbers.get(client_id)
+        if number is None:
+            number = self.numbers[client_id] = len(self.numbers) + 1
+        return number
+
+    def roster(self, clients, position):
+        for record in clients:
+            self.record(ROSTER, position, TEAMS[record.team], client=self.client(record.client_id))
+
+    def join(self, client_id, team, position):
+        self.record(JOIN, position, TEAMS[team], client=self.client(client_id))
+
+    def leave(self, client_id, team, position):
+        self.record(LEAVE, position, TEAMS[team], client=self.client(client_id))
+
+    def press(self, client_id, direction, count, position):
+        self.record(PRESS, position, TEAMS[direction], count, self.client(client_id))
+
+    def second(self, position):
+        self.record(SECOND, position)
+        self.flush()
+
+    def tick(self, position):
+        self.record(TICK, position)
+
+    def end(self, winner, position):
+        self.record(END, position, WINNERS[winner])
+        self.close()
+
+    def flush(self):
+        if self.buffer:
+            self.writer.submit(self.path, bytes(self.buffer))
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.submit(self.path, None)
+
+
+class JournalWriter(WriteBehind):
+    """Background thread appending journal buffers to their files"""
+
+    def __init__(self, flush_interval=0.5):
+        super().__init__('journal', flush_interval)
+        # queue: (path, bytes), or (path, None) to close the file
+        self.files = {}  # {path: open file}
+        self.matches = 0
+        self.errors = 0
+
+    def open_match(self, directory, room_id, tick_rate):
+        """New journal file for a match in room_id"""
+        self.matches += 1
+        name = "{}-{}-{}-{:04d}.towj".format(re.sub(r'[^A-Za-z0-9_-]', '_', room_id) or 'room',
+                                             time.strftime('%Y%m%d-%H%M%S'), os.getpid(), self.matches)
+        return MatchJournal(self, os.path.join(directory, name), room_id, tick_rate)
+
+    def submit(self, path, data):
+        self.enqueue((path, data))
+
+    def forked(self):
+        super().forked()
+        self.files = {}  # the parent's files; their buffers were flushed after its last write
+
+    def finish(self):
+        for fp in self.files.values():
+            fp.close()
+        self.files.clear()
+
+    def write_pending(self):
+        while self.queue:
+            path, data = self.queue.popleft()
+            try:
+                fp = self.files.get(path)
+                if data is None:
+                    if fp is not None:
+                        del self.files[path]
+                        fp.close()
+                    continue
+                if fp is None:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    fp = self.files[path] = open(path, 'ab', buffering=FLUSH_BYTES)
+                fp.write(data)
+            except OSError as e:
+                self.errors += 1
+                logging.warning(f"Journal write to {path} failed: {e}")
+        for fp in self.files.values():
+            fp.flush()
+
+
+class JournalReader:
+    """Memory-mapped journal file: header fields plus zero-copy record iteration"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.tick_rate, self.started, length = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} match journal")
+        self.room_id = self.map[HEADER.size:HEADER.size + length].decode(errors='replace')
+        self.offset = HEADER.size + length
+        # A file cut short by a crash ends in a partial record; it is ignored
+        self.count = (len(self.map) - self.offset) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def records(self):
+        """(t_ms, kind, team, count, client, position) tuples, in order"""
+        view = memoryview(self.map)[self.offset:self.offset + self.count * RECORD.size]
+        try:
+            yield from RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def duration(self):
+        if not self.count:
+            return 0.0
+        return RECORD.unpack_from(self.map, self.offset + (self.count - 1) * RECORD.size)[0] / 1000.0
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+journal = JournalWriter()
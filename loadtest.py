@@ -0,0 +1,337 @@
+"""Headless load generator: a swarm of simulated players for the game server.
+
+    python loadtest.py --bots 2000 --press-rate 5 --duration 60 --output run.json
+
+Every bot is a coroutine with its own connection. It joins, presses for
+its team at a random (Poisson) rate, and optionally leaves and rejoins
+(--churn). A separate task spams START_GAME. Nothing here needs pygame.
+
+With --journal (match journals recorded by the server, see journal.py) the
+bots press with the timing of real players instead: bot i repeats the
+presses of journaled player i % players, looping over the match.
+
+Measured, per run:
+  press latency   time from a press until the next state update reaches
+                  that bot (p50 / p95 / p99)
+  update jitter   spread of the intervals between updates seen by a bot
+  missed updates  state versions a bot never saw (GAME_DELTA versions skipped,
+                  e.g. coalesced by a slow outbox); needs deltas, on by default
+  throughput      presses sent, updates and bytes received per second, and
+                  the server's own press counter when --metrics-url is given
+
+Results are written as JSON (with the git commit) so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+import urllib.request
+
+from journal import JournalReader, PRESS
+from protocol import JSON, BINARY, FrameDecoder, encode, encode_json
+
+STATE_COMMANDS = ('GAME_UPDATE', 'GAME_DELTA')
+MAX_SAMPLES = 1000000  # per metric; later samples replace random earlier ones
+
+
+class Samples:
+    """Bounded sample set (reservoir sampling once full)"""
+
+    def __init__(self, limit=MAX_SAMPLES):
+        self.limit = limit
+        self.values = []
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if len(self.values) < self.limit:
+            self.values.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < self.limit:
+                self.values[i] = value
+
+    def summary(self, scale=1000.0):
+        """Percentiles in milliseconds (scale) of the collected samples"""
+        if not self.values:
+            return {'count': 0}
+        values = sorted(self.values)
+
+        def pct(p):
+            return round(values[min(len(values) - 1, int(p / 100.0 * len(values)))] * scale, 3)
+
+        return {
+            'count': self.count,
+            'mean': round(statistics.fmean(values) * scale, 3),
+            'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+            'max': round(values[-1] * scale, 3),
+        }
+
+
+class Swarm:
+    def __init__(self, host, port, bots, press_rate, duration, ramp=5.0, churn=0.0, start_rate=0.0,
+                 protocol=BINARY, deltas=True, rooms=1, shapes=None):
+        self.host = host
+        self.port = port
+        self.bots = bots
+        self.press_rate = press_rate  # presses per second per bot
+        self.duration = duration
+        self.ramp = ramp  # seconds over which bots connect
+        self.churn = churn  # leave+rejoin events per bot per second
+        self.start_rate = start_rate  # START_GAME commands per second, whole swarm
+        self.protocol = protocol
+        self.deltas = deltas
+        self.rooms = rooms
+        self.shapes = shapes  # [(press times [(seconds, count)], match seconds)] from journals, or None
+        self.writers = {}  # {bot: StreamWriter} of connected bots
+        self.latency = Samples()
+        self.intervals = Samples()
+        self.jitter = Samples()  # per bot: stdev of its update intervals
+        self.counts = {'connects': 0, 'connect_errors': 0, 'disconnects': 0, 'presses': 0,
+                       'updates': 0, 'missed_updates': 0, 'game_end': 0, 'game_error': 0,
+                       'start_game': 0, 'bytes_received': 0}
+        self.stop_at = 0.0
+
+    def running(self):
+        return time.monotonic() < self.stop_at
+
+    async def run(self):
+        self.stop_at = time.monotonic() + self.duration
+        tasks = [asyncio.create_task(self.bot(i)) for i in range(self.bots)]
+        if self.start_rate:
+            tasks.append(asyncio.create_task(self.start_spammer()))
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def bot(self, i):
+        await asyncio.sleep(self.ramp * i / max(1, self.bots))
+        room = 'bots-{}'.format(i % self.rooms) if self.rooms > 1 else None
+        while self.running():
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                self.counts['connect_errors'] += 1
+                await asyncio.sleep(1.0)
+                continue
+            self.counts['connects'] += 1
+            session_end = self.stop_at
+            if self.churn:
+                session_end = min(session_end, time.monotonic() + random.expovariate(self.churn))
+            try:
+                await self.session(i, room, reader, writer, session_end)
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self.writers.pop(i, None)
+                writer.close()
+                self.counts['disconnects'] += 1
+
+    async def session(self, i, room, reader, writer, session_end):
+        join = {'command': 'JOIN_GAME', 'protocol': self.protocol, 'deltas': self.deltas, 'name': f'bot-{i}'}
+        if room:
+            join['room'] = room
+        writer.write(encode_json(join))
+        state = {'team': None, 'pending': None, 'last_update': None, 'version': None, 'intervals': []}
+        self.writers[i] = writer
+        receiver = asyncio.create_task(self.receive(reader, state))
+        gaps = self.press_gaps(i)
+        try:
+            while time.monotonic() < session_end and not receiver.done():
+                delay, count = next(gaps)
+                await asyncio.sleep(delay)
+                if not count or state['team'] is None:
+                    continue
+                command = 'PRESS_LEFT' if state['team'] == 'left' else 'PRESS_RIGHT'
+                writer.write(encode({'command': command}, self.protocol) * count)
+                self.counts['presses'] += count
+                if state['pending'] is None:
+                    state['pending'] = time.perf_counter()
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+        finally:
+            receiver.cancel()
+            if len(state['intervals']) > 1:
+                self.jitter.add(statistics.pstdev(state['intervals']))
+
+    def press_gaps(self, i):
+        """(seconds to wait, presses to send) for bot i, forever"""
+        if not self.shapes:
+            while True:
+                if self.press_rate:
+                    yield random.expovariate(self.press_rate), 1
+                else:
+                    yield 1.0, 0
+        times, length = self.shapes[i % len(self.shapes)]
+        previous = base = 0.0
+        while True:
+            for t, count in times:
+                yield base + t - previous, count
+                previous = base + t
+            base += length
+
+    async def receive(self, reader, state):
+        decoder = FrameDecoder('server')
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            now = time.perf_counter()
+            self.counts['bytes_received'] += len(data)
+            decoder.feed(data)
+            for message in decoder.messages():
+                if message.get('command') == 'PROTOCOL_ACK':
+                    # Everything after the ack is binary frames
+                    decoder.binary = message.get('protocol') == BINARY
+                    continue
+                self.handle(message, state, now)
+
+    def handle(self, message, state, now):
+        cmd = message.get('command')
+        if cmd in STATE_COMMANDS:
+            self.counts['updates'] += 1
+            if state['pending'] is not None:
+                self.latency.add(now - state['pending'])
+                state['pending'] = None
+            if state['last_update'] is not None:
+                interval = now - state['last_update']
+                self.intervals.add(interval)
+                state['intervals'].append(interval)
+            state['last_update'] = now
+            version = message.get('version')
+            if version is not None:
+                if state['version'] is not None and version > state['version'] + 1:
+                    self.counts['missed_updates'] += version - state['version'] - 1
+                state['version'] = version
+        elif cmd == 'TEAM_ASSIGNED':
+            state['team'] = message.get('team')
+        elif cmd == 'GAME_END':
+            self.counts['game_end'] += 1
+        elif cmd == 'GAME_ERROR':
+            self.counts['game_error'] += 1
+
+    async def start_spammer(self):
+        message = encode({'command': 'START_GAME'}, self.protocol)
+        while self.running():
+            await asyncio.sleep(random.expovariate(self.start_rate))
+            if self.writers:
+                writer = random.choice(list(self.writers.values()))
+                writer.write(message)
+                self.counts['start_game'] += 1
+
+
+def journal_shapes(paths):
+    """Press timing of every player in the given match journals"""
+    shapes = []
+    for path in paths:
+        with JournalReader(path) as reader:
+            length = reader.duration()
+            players = {}
+            for t_ms, kind, _, count, client, _ in reader.records():
+                if kind == PRESS:
+                    players.setdefault(client, []).append((t_ms / 1000.0, count))
+        if length > 0:
+            shapes.extend((times, length) for times in players.values())
+    return shapes
+
+
+def scrape_presses(url):
+    """Server-side accepted press count from /metrics (summed over segments), or None"""
+    try:
+        text = urllib.request.urlopen(url, timeout=5).read().decode()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        if line.startswith('tugofwar_presses_total'):
+            return float(line.split()[-1])
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def raise_fd_limit():
+    """Thousands of bots need thousands of descriptors (Unix only)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tug of War bot swarm load generator')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=55555)
+    parser.add_argument('--bots', type=int, default=100)
+    parser.add_argument('--press-rate', type=float, default=5.0, help='presses per second per bot')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds to connect all bots')
+    parser.add_argument('--churn', type=float, default=0.0,
+                        help='leave/rejoin events per bot per second (0.1 = every ~10 s)')
+    parser.add_argument('--start-rate', type=float, default=0.5, help='START_GAME per second, whole swarm')
+    parser.add_argument('--protocol', choices=[JSON, BINARY], default=BINARY)
+    parser.add_argument('--no-deltas', action='store_true', help='plain GAME_UPDATE (missed updates not counted)')
+    parser.add_argument('--rooms', type=int, default=1, help='spread bots over this many rooms')
+    parser.add_argument('--journal', action='append', default=[], metavar='FILE',
+                        help='press like the players in this match journal (repeatable); overrides --press-rate')
+    parser.add_argument('--metrics-url', default=None, help='e.g. http://localhost:8080/metrics')
+    parser.add_argument('--output', default='loadtest.json')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    shapes = journal_shapes(args.journal) if args.journal else None
+    if args.journal and not shapes:
+        parser.error('no presses found in the given journals')
+    swarm = Swarm(args.host, args.port, args.bots, args.press_rate, args.duration, ramp=args.ramp,
+                  churn=args.churn, start_rate=args.start_rate, protocol=args.protocol,
+                  deltas=not args.no_deltas, rooms=args.rooms, shapes=shapes)
+    pressing = f"{len(shapes)} journaled players" if shapes else f"{args.press_rate}/s each"
+    print(f"🤖 {args.bots} bots -> {args.host}:{args.port} for {args.duration:.0f}s "
+          f"({pressing}, {args.protocol})")
+
+    server_before = scrape_presses(args.metrics_url) if args.metrics_url else None
+    started = time.monotonic()
+    asyncio.run(swarm.run())
+    elapsed = time.monotonic() - started
+    server_after = scrape_presses(args.metrics_url) if args.metrics_url else None
+
+    counts = swarm.counts
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': vars(args),
+        'elapsed': round(elapsed, 3),
+        'counts': counts,
+        'throughput': {
+            'presses_per_sec': round(counts['presses'] / elapsed, 1),
+            'updates_per_sec': round(counts['updates'] / elapsed, 1),
+            'bytes_per_sec': round(counts['bytes_received'] / elapsed, 1),
+        },
+        'press_latency_ms': swarm.latency.summary(),
+        'update_interval_ms': swarm.intervals.summary(),
+        'update_jitter_ms': swarm.jitter.summary(),
+    }
+    if server_before is not None and server_after is not None:
+        results['throughput']['server_presses_per_sec'] = round((server_after - server_before) / elapsed, 1)
+
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+    latency = results['press_latency_ms']
+    print(f"✅ {counts['presses']} presses, {counts['updates']} updates, "
+          f"{counts['missed_updates']} missed, {counts['connect_errors']} connect errors")
+    if latency['count']:
+        print(f"   press latency p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    print(f"   results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
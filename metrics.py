@@ -0,0 +1,162 @@
+"""Pre-allocated telemetry for the game and HTTP servers, rendered as Prometheus text.
+
+Every counter, gauge and histogram bucket is a fixed slot in one flat array
+of doubles defined at import time, so recording an event is an index and an
+add: no dicts, locks or allocation on the hot path. Updates are unlocked,
+so increments racing on the same slot from several threads may
+occasionally be lost; that is the price of leaving this on in production.
+
+With worker processes the array is moved to shared memory with one segment
+per process; /metrics sums the segments.
+"""
+import multiprocessing
+from array import array
+from bisect import bisect_left
+
+DURATION_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram:
+    def __init__(self, registry, name, help, buckets, labels):
+        self.registry = registry
+        self.buckets = buckets
+        self.base = registry.allocate(len(buckets) + 3)  # buckets, +Inf, sum, count
+        registry.layout.append(('histogram', name, help, labels, self))
+
+    def observe(self, value):
+        values = self.registry.values
+        base = self.registry.offset + self.base
+        values[base + bisect_left(self.buckets, value)] += 1
+        n = len(self.buckets)
+        values[base + n + 1] += value
+        values[base + n + 2] += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.layout = []  # (type, name, help, labels, slot index | Histogram)
+        self.size = 0
+        self.values = array('d')
+        self.offset = 0  # start of this process's segment
+        self.segments = 1
+
+    def allocate(self, n):
+        index = self.size
+        self.size += n
+        self.values.extend([0.0] * n)
+        return index
+
+    def counter(self, name, help, **labels):
+        index = self.allocate(1)
+        self.layout.append(('counter', name, help, labels, index))
+        return index
+
+    def gauge(self, name, help, **labels):
+        index = self.allocate(1)
+        self.layout.append(('gauge', name, help, labels, index))
+        return index
+
+    def histogram(self, name, help, buckets=DURATION_BUCKETS, **labels):
+        return Histogram(self, name, help, buckets, labels)
+
+    def inc(self, index, value=1.0):
+        self.values[self.offset + index] += value
+
+    def dec(self, index, value=1.0):
+        self.values[self.offset + index] -= value
+
+    def set(self, index, value):
+        self.values[self.offset + index] = value
+
+    def share(self, segments):
+        """Move storage to shared memory before forking workers; this process keeps segment 0"""
+        shared = multiprocessing.RawArray('d', self.size * segments)
+        shared[:self.size] = self.values.tolist()
+        self.values = shared
+        self.segments = segments
+        self.offset = 0
+        return shared
+
+    def attach(self, shared, segment):
+        """Worker side of share()"""
+        self.values = shared
+        self.segments = len(shared) // self.size
+        self.offset = segment * self.size
+
+    def total(self, index):
+        return sum(self.values[s * self.size + index] for s in range(self.segments))
+
+    def render(self):
+        lines = []
+        described = set()
+        for kind, name, help, labels, slot in self.layout:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                cumulative = 0.0
+                bounds = [repr(b) for b in slot.buckets] + ['+Inf']
+                for i, bound in enumerate(bounds):
+                    cumulative += self.total(slot.base + i)
+                    lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {cumulative:g}")
+                n = len(slot.buckets)
+                lines.append(f"{name}_sum{format_labels(labels)} {self.total(slot.base + n + 1):g}")
+                lines.append(f"{name}_count{format_labels(labels)} {self.total(slot.base + n + 2):g}")
+            else:
+                lines.append(f"{name}{format_labels(labels)} {self.total(slot):g}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels, **extra):
+    items = dict(labels, **extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items.items()) + '}'
+
+
+def run_tracked(pool, fn, *args):
+    """Executor task wrapper maintaining the busy / queued gauges of a pool"""
+    metrics.dec(POOL_QUEUED[pool])
+    metrics.inc(POOL_BUSY[pool])
+    try:
+        return fn(*args)
+    finally:
+        metrics.dec(POOL_BUSY[pool])
+
+
+metrics = Metrics()
+
+COMMAND_TYPES = ('JOIN_GAME', 'PRESS', 'PRESS_LEFT', 'PRESS_RIGHT', 'START_GAME', 'other')
+
+CONNECTIONS = metrics.gauge('tugofwar_game_connections', 'Open game connections')
+PLAYERS = {team: metrics.gauge('tugofwar_players', 'Players per team, all rooms', team=team)
+           for team in ('left', 'right')}
+ROOMS = metrics.gauge('tugofwar_rooms', 'Active rooms')
+COMMANDS = {t: metrics.counter('tugofwar_commands_total', 'Commands received by type', type=t)
+            for t in COMMAND_TYPES}
+PRESSES = metrics.counter('tugofwar_presses_total', 'Accepted button presses (rate() gives presses/sec)')
+GAMES_STARTED = metrics.counter('tugofwar_games_started_total', 'Rounds started')
+GAMES_ENDED = metrics.counter('tugofwar_games_ended_total', 'Rounds finished')
+BROADCASTS = metrics.counter('tugofwar_broadcasts_total', 'Messages fanned out to a room')
+BROADCAST_RECIPIENTS = metrics.counter('tugofwar_broadcast_recipients_total', 'Frames queued by broadcasts')
+BROADCAST_SECONDS = metrics.histogram('tugofwar_broadcast_fanout_seconds', 'Time to queue one broadcast for every recipient')
+ACTOR_WAIT = metrics.histogram('tugofwar_actor_wait_seconds', 'Age of the oldest message in a batch taken from a room inbox')
+ACTOR_BATCH = metrics.histogram('tugofwar_actor_batch_size', 'Messages handled per room actor batch',
+                                buckets=(1, 2, 5, 10, 50, 100, 500, 1024))
+ACTOR_DROPPED = metrics.counter('tugofwar_actor_dropped_total', 'Client commands dropped because a room inbox was full')
+RATE_LIMITED = {c: metrics.counter('tugofwar_rate_limited_total', 'Client messages dropped by the per-connection rate limit', type=c)
+                for c in ('press', 'start', 'other', 'oversized')}
+FLOOD_DISCONNECTS = metrics.counter('tugofwar_flood_disconnects_total', 'Connections closed for flooding the game port')
+OUTBOUND_BYTES = metrics.counter('tugofwar_outbound_bytes_total', 'Bytes handed to game sockets')
+OUTBOUND_COALESCED = metrics.counter('tugofwar_outbound_coalesced_total', 'Pending updates replaced by a newer one')
+EVICTIONS = metrics.counter('tugofwar_evictions_total', 'Clients dropped for lagging behind')
+POOL_SIZE = {p: metrics.gauge('tugofwar_pool_workers', 'Thread pool size', pool=p) for p in ('game', 'http')}
+POOL_BUSY = {p: metrics.gauge('tugofwar_pool_busy', 'Thread pool workers running a task', pool=p) for p in ('game', 'http')}
+POOL_QUEUED = {p: metrics.gauge('tugofwar_pool_queued', 'Tasks waiting for a pool worker', pool=p) for p in ('game', 'http')}
+HTTP_REQUESTS = metrics.counter('tugofwar_http_requests_total', 'HTTP requests served')
+HTTP_CONNECTIONS = metrics.gauge('tugofwar_http_connections', 'Open HTTP connections, including idle keep-alive ones')
+HTTP_STREAMS = metrics.gauge('tugofwar_http_streams', 'HTTP connections following a live event stream (spectators)')
+STATIC_CACHE = {r: metrics.counter('tugofwar_static_cache_total', 'Static file lookups by result', result=r)
+                for r in ('hit', 'revalidated', 'miss')}
+STATIC_CACHE_BYTES = metrics.gauge('tugofwar_static_cache_bytes', 'Bytes held by the static file cache, compressed variants included')
@@ -0,0 +1,188 @@
+"""Client side of the game connection, off the pygame thread.
+
+ServerConnection owns the socket and runs its own selector loop. The render
+loop never touches the socket:
+
+  send(command)     queues an encoded frame and returns at once
+  press(direction)  only bumps a counter; the loop sends one PRESS message per
+                    direction with the number of presses, at most one per
+                    press_interval (the first press after a pause goes out at
+                    once; above MAX_PRESS_COUNT the rest waits for the next).
+                    Presses are numbered 1, 2, 3...; each PRESS carries the
+                    number of the last press it counts as its seq, which the
+                    server acknowledges with PRESS_ACK (see prediction.py).
+                    This pacing is a courtesy: the server limits presses
+                    per connection itself (ratelimit.py)
+  received()        the messages decoded since the last call
+
+A congested link backs up in this module's queue, not in the frame loop.
+"""
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+from protocol import JSON, BINARY, DIRECTIONS, MAX_PRESS_COUNT, FrameDecoder, encode
+
+MAX_QUEUED = 256  # outbound frames; beyond this new commands are dropped
+
+
+class ServerConnection:
+    def __init__(self, address, press_interval=0.05):
+        self.address = address
+        self.press_interval = press_interval
+        self.protocol = JSON  # for sending; set by join()
+        self.sock = None
+        self.connected = False
+        self.outbound = deque()  # encoded frames
+        self.out_buffer = b""  # part of a frame the socket did not take yet
+        self.presses = {'left': 0, 'right': 0}
+        self.press_lock = threading.Lock()
+        self.next_flush = 0.0  # monotonic time the next PRESS may be sent
+        self.press_seq = 0  # number of the last press counted
+        self.sent_seq = 0  # number of the last press put in a PRESS message
+        self.inbox = deque()  # decoded messages for the render loop
+        self.dropped = 0
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+
+    def connect(self, timeout=5.0):
+        """Blocking connect, then the selector thread takes over"""
+        self.sock = socket.create_connection(self.address, timeout=timeout)
+        # Small frames must not wait for Nagle's algorithm
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(False)
+        self.connected = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def join(self, protocol=BINARY, deltas=True, name=None):
+        """Send JOIN_GAME (always JSON); later commands use the negotiated protocol"""
+        command = {'command': 'JOIN_GAME', 'protocol': protocol, 'deltas': deltas}
+        if name:
+            command['name'] = name  # shown on /leaderboard
+        with self.press_lock:
+            self.outbound.append(encode(command, JSON))
+            self.protocol = protocol
+        self.wake()
+
+    def send(self, command):
+        """Queue a command; False if disconnected or the queue is full"""
+        if not self.connected:
+            return False
+        if len(self.outbound) >= MAX_QUEUED:
+            self.dropped += 1
+            return False
+        self.outbound.append(encode(command, self.protocol))
+        self.wake()
+        return True
+
+    def press(self, direction):
+        """Count a press; it goes out with the next PRESS message. Returns its sequence number"""
+        with self.press_lock:
+            first = not any(self.presses.values())
+            self.presses[direction] += 1
+            self.press_seq += 1
+            seq = self.press_seq
+        if first:
+            self.wake()
+        return seq
+
+    def received(self):
+        """Messages decoded since the last call (never blocks)"""
+        messages = []
+        while self.inbox:
+            messages.append(self.inbox.popleft())
+        return messages
+
+    def close(self):
+        self.connected = False
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # a wake-up is already pending
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.wake_r, selectors.EVENT_READ)
+        selector.register(self.sock, selectors.EVENT_READ)
+        decoder = FrameDecoder('server')
+        try:
+            while self.connected:
+                timeout = None
+                if any(self.presses.values()):
+                    timeout = self.next_flush - time.monotonic()
+                    if timeout <= 0:
+                        self.flush_presses()
+                        timeout = self.press_interval if any(self.presses.values()) else None
+                events = selectors.EVENT_READ
+                if self.out_buffer or self.outbound:
+                    events |= selectors.EVENT_WRITE
+                selector.modify(self.sock, events)
+                for key, mask in selector.select(timeout=timeout):
+                    if key.fileobj is self.wake_r:
+                        try:
+                            self.wake_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    if mask & selectors.EVENT_READ and not self.read(decoder):
+                        return
+                    if mask & selectors.EVENT_WRITE:
+                        self.write()
+        except OSError as e:
+            if self.connected:
+                logging.warning(f"Connection error: {e}")
+        finally:
+            self.connected = False
+            selector.close()
+            self.sock.close()
+            print("Disconnected from server")
+
+    def read(self, decoder):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return True
+        if not data:
+            return False
+        decoder.feed(data)
+        for message in decoder.messages():
+            if message.get('command') == 'PROTOCOL_ACK':
+                # Everything after the ack is binary frames
+                decoder.binary = message.get('protocol') == BINARY
+                continue
+            self.inbox.append(message)
+        return True
+
+    def write(self):
+        while True:
+            if not self.out_buffer:
+                if not self.outbound:
+                    return
+                # Whatever is queued goes out in as few send() calls as possible
+                frames = []
+                while self.outbound:
+                    frames.append(self.outbound.popleft())
+                self.out_buffer = b"".join(frames)
+            try:
+                sent = self.sock.send(self.out_buffer)
+            except BlockingIOError:
+                return
+            self.out_buffer = self.out_buffer[sent:]
+
+    def flush_presses(self):
+        self.next_flush = time.monotonic() + self.press_interval
+        with self.press_lock:
+            counts = [(d, min(self.presses[d], MAX_PRESS_COUNT)) for d in DIRECTIONS if self.presses[d]]
+            for direction, count in counts:
+                self.presses[direction] -= count
+            for direction, count in counts:
+                self.sent_seq += count
+                self.outbound.append(encode({'command': 'PRESS', 'direction': direction, 'count': count,
+                                             'seq': self.sent_seq}, self.protocol))
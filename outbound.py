@@ -0,0 +1,153 @@
+import socket
+import threading
+import time
+from collections import deque
+
+from metrics import metrics, OUTBOUND_BYTES, OUTBOUND_COALESCED
+
+
+class OutboundQueue:
+    """Bounded per-connection send buffer, drained by a background writer.
+
+    Frames of a coalescable kind (GAME_UPDATE) replace any still-pending frame
+    of the same kind, so a slow consumer only ever receives the latest state.
+    A barrier frame (PRESS_ACK) seals the pending frames ahead of it: a later
+    state frame is queued behind the barrier instead of overwriting one in
+    front of it, so the client never sees state that is newer than an ack it
+    has not received yet. A consumer whose backlog grows past max_frames, or
+    whose oldest pending frame is older than max_lag seconds, is evicted.
+    """
+
+    COALESCE = ('GAME_UPDATE',)
+    BARRIERS = ('PRESS_ACK',)
+
+    def __init__(self, max_frames=64, max_lag=5.0):
+        self.max_frames = max_frames
+        self.max_lag = max_lag
+        self.frames = deque()  # [kind, data, enqueued_at, state_version]
+        self.pending = {}  # {kind: frame} for coalescable frames not yet sent
+        self.cond = threading.Condition()
+        self.closed = False
+        self.evicted = False
+        self.coalesced = 0
+        self.sent_bytes = 0
+        self.delivered_version = None  # last state version handed to the socket
+        self.sealed_version = None  # newest state frame sealed by a barrier, still queued (sent for sure)
+        self.on_ready = None  # callback for event-loop writers
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, data, kind=None):
+        """Queue a frame; returns False if the connection is closed or was just evicted"""
+        with self.cond:
+            accepted = self._enqueue(kind, data, None)
+            ready = self.on_ready
+        if ready:
+            ready()
+        return accepted
+
+    def put_state(self, version, encode_delta):
+        """Queue a state frame built by encode_delta(base_version).
+
+        The base is read under the queue lock, so it is always a state the
+        client will have received first: the last one written to the socket,
+        or a queued frame sealed by a barrier (a replaced pending frame never
+        is written).
+        """
+        with self.cond:
+            if self.closed:
+                return False
+            base = self.sealed_version if self.sealed_version is not None else self.delivered_version
+            accepted = self._enqueue('GAME_UPDATE', encode_delta(base), version)
+            ready = self.on_ready
+        if ready:
+            ready()
+        return accepted
+
+    def _enqueue(self, kind, data, version):
+        if self.closed:
+            return False
+        now = time.monotonic()
+        frame = self.pending.get(kind)
+        if frame is not None:
+            # Keep the original timestamp: the consumer is still that far behind
+            frame[1] = data
+            frame[3] = version
+            self.coalesced += 1
+            metrics.inc(OUTBOUND_COALESCED)
+        elif len(self.frames) >= self.max_frames or \
+                (self.frames and now - self.frames[0][2] > self.max_lag):
+            self.evicted = True
+            self.closed = True
+            self.cond.notify_all()
+            return False
+        else:
+            frame = [kind, data, now, version]
+            self.frames.append(frame)
+            if kind in self.BARRIERS and self.pending:
+                # The pending frames stay queued as they are; later ones go behind this frame
+                state = self.pending.get('GAME_UPDATE')
+                if state is not None and state[3] is not None:
+                    self.sealed_version = state[3]
+                self.pending.clear()
+            if kind in self.COALESCE:
+                self.pending[kind] = frame
+            self.cond.notify()
+        return True
+
+    def _pop(self):
+        frame = self.frames.popleft()
+        if self.pending.get(frame[0]) is frame:
+            del self.pending[frame[0]]
+        if frame[3] is not None:
+            self.delivered_version = frame[3]
+            if frame[3] == self.sealed_version:
+                self.sealed_version = None
+        self.sent_bytes += len(frame[1])
+        metrics.inc(OUTBOUND_BYTES, len(frame[1]))
+        return frame[1]
+
+    def get(self, timeout=None):
+        """Blocking pop for thread writers; returns None once the queue is closed"""
+        with self.cond:
+            while not self.frames and not self.closed:
+                if not self.cond.wait(timeout):
+                    return None
+            if self.closed:
+                return None
+            return self._pop()
+
+    def pop_nowait(self):
+        with self.cond:
+            if self.closed or not self.frames:
+                return None
+            return self._pop()
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+            ready = self.on_ready
+        if ready:
+            ready()
+
+
+def socket_writer(sock, outbox):
+    """Writer thread for the threaded engine: drain outbox into a blocking socket"""
+    while True:
+        data = outbox.get()
+        if data is None:
+            break
+        try:
+            sock.sendall(data)
+        except OSError:
+            outbox.close()
+            break
+    # Wake the reader thread so it runs its normal cleanup
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
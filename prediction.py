@@ -0,0 +1,101 @@
+"""Client-side prediction and interpolation of the bar position.
+
+The server is authoritative, but waiting for it makes the indicator lag by a
+round trip (or, between presses, by up to a second of broadcast interval).
+BarPredictor keeps:
+
+  server position   the last authoritative bar_position (state update,
+                    GAME_END or PRESS_ACK)
+  pending presses   own presses the server has not acknowledged yet
+                    (press sequence numbers above the last PRESS_ACK)
+
+predicted() = server position + own pending pulls, so a press moves the bar
+at once; when its PRESS_ACK arrives the pending pull is replaced by the
+server's number, which also contains everyone else's pulls (reconciliation).
+Acks are queued on the connection before any later state frame, and a
+state frame queued ahead of an ack is never replaced by a newer one (the
+outbound queue seals it), so a state update always includes exactly the
+presses acknowledged before it.
+
+The indicator itself does not jump to the new value: value() moves linearly
+from wherever it was drawn to the new target, within a short window for own
+presses and over (at most) the observed time between state updates for
+everyone else's movement.
+"""
+import time
+
+BAR_LIMIT = 50
+PRESS_WINDOW = 0.05  # seconds to show an own (predicted) press
+MIN_WINDOW, MAX_WINDOW = 0.05, 0.25  # bounds for interpolating remote movement
+
+
+class BarPredictor:
+    def __init__(self):
+        self.direction = 0  # own pull per press: -1 (left team) or +1 (right team)
+        self.server_position = 0
+        self.sent_seq = 0  # sequence number of the last own press
+        self.acked_seq = 0  # last sequence number acknowledged by the server
+        self.update_interval = MAX_WINDOW  # smoothed time between state updates
+        self.last_update = None
+        # Current animation: from start to target over window seconds from started_at
+        self.start = 0.0
+        self.target = 0
+        self.started_at = 0.0
+        self.window = 0.0
+
+    def set_team(self, team):
+        self.direction = -1 if team == 'left' else 1
+
+    @property
+    def pending(self):
+        return self.sent_seq - self.acked_seq
+
+    def predicted(self):
+        """Bar position including own presses that are still in flight"""
+        position = self.server_position + self.direction * self.pending
+        return max(-BAR_LIMIT, min(BAR_LIMIT, position))
+
+    def value(self, now=None):
+        """Position to draw now (a float between the previous and the predicted position)"""
+        if self.window <= 0:
+            return float(self.target)
+        now = time.monotonic() if now is None else now
+        progress = (now - self.started_at) / self.window
+        if progress >= 1:
+            self.window = 0.0
+            return float(self.target)
+        return self.start + (self.target - self.start) * progress
+
+    def press(self, seq):
+        """An own press with sequence number seq was queued for the server"""
+        self.sent_seq = seq
+        self.retarget(PRESS_WINDOW)
+
+    def ack(self, seq, position):
+        """PRESS_ACK: presses up to seq are in position"""
+        self.acked_seq = max(self.acked_seq, min(seq, self.sent_seq))
+        self.server_position = position
+        self.retarget(self.remote_window())
+
+    def update(self, position):
+        """Authoritative bar_position from a state update or GAME_END"""
+        now = time.monotonic()
+        if self.last_update is not None:
+            interval = min(now - self.last_update, 1.0)
+            self.update_interval += (interval - self.update_interval) * 0.25
+        self.last_update = now
+        self.server_position = position
+        self.retarget(self.remote_window())
+
+    def remote_window(self):
+        return max(MIN_WINDOW, min(MAX_WINDOW, self.update_interval))
+
+    def retarget(self, window):
+        target = self.predicted()
+        if target == self.target:
+            return
+        now = time.monotonic()
+        self.start = self.value(now)
+        self.target = target
+        self.started_at = now
+        self.window = window
@@ -0,0 +1,254 @@
+"""Wire protocol shared by http_server.py and client.py.
+
+Every connection starts with newline-delimited JSON. A client may ask for
+the binary protocol in its JOIN_GAME ({"command": "JOIN_GAME", "protocol":
+"binary"}); from then on it sends binary frames, and the server answers with
+a JSON PROTOCOL_ACK line followed by binary frames only.
+
+Binary frame: 2-byte big-endian length of the rest of the frame, 1-byte
+message type, then a fixed struct layout for that type. Messages without a
+fixed layout travel as a JSON document inside a T_JSON frame.
+"""
+import json
+import logging
+import struct
+import time
+
+JSON = 'json'
+BINARY = 'binary'
+
+HEADER = struct.Struct('>HB')
+
+T_GAME_UPDATE = 0x01
+T_GAME_END = 0x02
+T_PRESS_LEFT = 0x03
+T_PRESS_RIGHT = 0x04
+T_PING = 0x05
+T_START_GAME = 0x06
+T_GAME_DELTA = 0x07
+T_PRESS = 0x08
+T_PRESS_ACK = 0x09
+T_JSON = 0x7F
+
+PING_INTERVAL = 30.0  # seconds of silence from a client before the server sends PING
+
+# bar_position, timer, left_count, right_count, game_active, winner
+GAME_UPDATE = struct.Struct('>hHHHBB')
+# winner, bar_position
+GAME_END = struct.Struct('>Bh')
+# direction (0 left, 1 right), count, sequence number of the last press counted (0 = none)
+PRESS = struct.Struct('>BHI')
+# PRESS_ACK: sequence number, bar_position once that press was applied
+PRESS_ACK = struct.Struct('>Ih')
+DIRECTIONS = ('left', 'right')
+MAX_PRESS_COUNT = 20  # presses one PRESS message may carry; larger counts are clamped
+
+# GAME_DELTA: version, base version (0 = full snapshot), field mask, then the
+# masked fields in STATE_FIELDS order
+DELTA_HEADER = struct.Struct('>IIB')
+STATE_FIELDS = ('bar_position', 'timer', 'left_count', 'right_count', 'game_active', 'winner')
+STATE_FORMATS = tuple(struct.Struct('>' + f) for f in ('h', 'H', 'H', 'H', 'B', 'B'))
+
+WINNERS = (None, 'LEFT', 'RIGHT', 'DRAW')
+WINNER_CODES = {w: i for i, w in enumerate(WINNERS)}
+
+# Messages that are only a type byte
+BARE_TYPES = {
+    'PRESS_LEFT': T_PRESS_LEFT,
+    'PRESS_RIGHT': T_PRESS_RIGHT,
+    'PING': T_PING,
+    'START_GAME': T_START_GAME,
+}
+BARE_COMMANDS = {t: c for c, t in BARE_TYPES.items()}
+
+
+def join_options(command):
+    """Connection options negotiated by a JOIN_GAME message"""
+    if command.get('command') != 'JOIN_GAME':
+        return {'protocol': JSON, 'deltas': False, 'name': None}
+    return {
+        'protocol': BINARY if command.get('protocol') == BINARY else JSON,
+        'deltas': bool(command.get('deltas')),
+        'name': str(command['name'])[:32] if command.get('name') else None
+    }
+
+
+def press_count(command):
+    """Presses carried by a PRESS message (1 to MAX_PRESS_COUNT), 0 if it is malformed.
+
+    The count comes from the client; how many presses a connection may send
+    per second is enforced on the server by ratelimit.py, not by the pacing in
+    network.py.
+    """
+    try:
+        count = int(command.get('count', 1))
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(count, MAX_PRESS_COUNT))
+
+
+def press_seq(command):
+    """Sequence number of a PRESS message, None if it has none"""
+    seq = command.get('seq')
+    return seq if isinstance(seq, int) and seq > 0 else None
+
+
+def encode_json(message):
+    return (json.dumps(message) + '\n').encode()
+
+
+def frame(msg_type, payload=b''):
+    return HEADER.pack(len(payload) + 1, msg_type) + payload
+
+
+def encode_binary(message):
+    cmd = message.get('command')
+    if cmd == 'GAME_UPDATE':
+        return frame(T_GAME_UPDATE, GAME_UPDATE.pack(
+            message['bar_position'], message['timer'],
+            message['left_count'], message['right_count'],
+            bool(message['game_active']), WINNER_CODES.get(message['winner'], 0)))
+    if cmd == 'GAME_END':
+        return frame(T_GAME_END, GAME_END.pack(
+            WINNER_CODES.get(message['winner'], 0), message['bar_position']))
+    if cmd == 'GAME_DELTA':
+        mask = 0
+        fields = []
+        for i, name in enumerate(STATE_FIELDS):
+            if name in message:
+                mask |= 1 << i
+                value = message[name]
+                if name == 'winner':
+                    value = WINNER_CODES.get(value, 0)
+                fields.append(STATE_FORMATS[i].pack(value))
+        return frame(T_GAME_DELTA, DELTA_HEADER.pack(message['version'], message['base'], mask) + b''.join(fields))
+    if cmd == 'PRESS' and message.get('direction') in DIRECTIONS:
+        return frame(T_PRESS, PRESS.pack(DIRECTIONS.index(message['direction']),
+                                         min(message.get('count', 1), 0xFFFF), message.get('seq') or 0))
+    if cmd == 'PRESS_ACK':
+        return frame(T_PRESS_ACK, PRESS_ACK.pack(message['seq'], message['bar_position']))
+    if cmd in BARE_TYPES and len(message) == 1:
+        return frame(BARE_TYPES[cmd])
+    return frame(T_JSON, json.dumps(message).encode())
+
+
+def encode(message, protocol):
+    if protocol == BINARY:
+        return encode_binary(message)
+    return encode_json(message)
+
+
+def decode_binary(msg_type, payload):
+    if msg_type == T_GAME_UPDATE:
+        bar, timer, left, right, active, winner = GAME_UPDATE.unpack(payload)
+        return {'command': 'GAME_UPDATE', 'bar_position': bar, 'timer': timer,
+                'left_count': left, 'right_count': right,
+                'game_active': bool(active), 'winner': WINNERS[winner]}
+    if msg_type == T_GAME_END:
+        winner, bar = GAME_END.unpack(payload)
+        return {'command': 'GAME_END', 'winner': WINNERS[winner], 'bar_position': bar}
+    if msg_type == T_GAME_DELTA:
+        version, base, mask = DELTA_HEADER.unpack_from(payload)
+        message = {'command': 'GAME_DELTA', 'version': version, 'base': base}
+        offset = DELTA_HEADER.size
+        for i, name in enumerate(STATE_FIELDS):
+            if mask & (1 << i):
+                value, = STATE_FORMATS[i].unpack_from(payload, offset)
+                offset += STATE_FORMATS[i].size
+                if name == 'winner':
+                    value = WINNERS[value]
+                elif name == 'game_active':
+                    value = bool(value)
+                message[name] = value
+        return message
+    if msg_type == T_PRESS:
+        direction, count, seq = PRESS.unpack(payload)
+        message = {'command': 'PRESS', 'direction': DIRECTIONS[direction], 'count': count}
+        if seq:
+            message['seq'] = seq
+        return message
+    if msg_type == T_PRESS_ACK:
+        seq, bar = PRESS_ACK.unpack(payload)
+        return {'command': 'PRESS_ACK', 'seq': seq, 'bar_position': bar}
+    if msg_type in BARE_COMMANDS:
+        return {'command': BARE_COMMANDS[msg_type]}
+    if msg_type == T_JSON:
+        return json.loads(payload)
+    raise ValueError(f"unknown frame type {msg_type:#x}")
+
+
+class FrameDecoder:
+    """Incremental decoder for one connection; starts in JSON mode.
+
+    Set binary = True while iterating messages() to switch the rest of the
+    stream (including bytes already buffered) to binary framing.
+    """
+
+    def __init__(self, name='', binary=False, on_error=None, limiter=None, max_line=None):
+        self.name = name
+        self.binary = binary
+        self.on_error = on_error or logging.warning
+        self.buffer = bytearray()
+        # Server side only (ratelimit.py): messages over the limit are dropped before decoding
+        self.limiter = limiter
+        self.max_line = max_line  # longest JSON line kept while waiting for its newline
+
+    def feed(self, data):
+        self.buffer += data
+
+    def messages(self):
+        limiter = self.limiter
+        now = time.monotonic() if limiter is not None else 0.0
+        while True:
+            if limiter is not None and limiter.offender:
+                return
+            if self.binary:
+                if len(self.buffer) < HEADER.size:
+                    return
+                length, msg_type = HEADER.unpack_from(self.buffer)
+                if length == 0:
+                    self.on_error(f"Invalid frame from {self.name}: zero length")
+                    del self.buffer[:2]
+                    continue
+                end = 2 + length
+                if len(self.buffer) < end:
+                    return
+                payload = bytes(self.buffer[HEADER.size:end])
+                del self.buffer[:end]
+                if limiter is not None and not limiter.allow_frame(msg_type, payload, now):
+                    continue
+                try:
+                    message = decode_binary(msg_type, payload)
+                except (ValueError, struct.error, IndexError) as e:
+                    self.on_error(f"Invalid frame from {self.name}: {e}")
+                    continue
+                if not isinstance(message, dict):
+                    self.on_error(f"Invalid frame from {self.name}: JSON payload is not an object")
+                    continue
+                if msg_type == T_JSON and limiter is not None and not limiter.allow_decoded(message, now):
+                    continue
+                yield message
+            else:
+                end = self.buffer.find(b'\n')
+                if end < 0:
+                    if self.max_line is not None and len(self.buffer) > self.max_line:
+                        self.on_error(f"Invalid JSON from {self.name}: line longer than {self.max_line} bytes")
+                        self.buffer.clear()
+                        if limiter is not None:
+                            limiter.drop('oversized', now)
+                    return
+                line = bytes(self.buffer[:end]).strip()
+                del self.buffer[:end + 1]
+                if not line:
+                    continue
+                if limiter is not None and not limiter.allow_line(line, now):
+                    continue
+                try:
+                    message = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    self.on_error(f"Invalid JSON from {self.name}: {line[:80]} | Error: {e}")
+                    continue
+                if limiter is not None and not limiter.allow_decoded(message, now):
+                    continue
+                if isinstance(message, dict):
+                    yield message
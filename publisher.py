@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+from protocol import STATE_FIELDS, encode
+
+
+class StatePublisher:
+    """Versioned game state, encoded once per version and shared by all recipients.
+
+    publish() returns None when the state did not change, so callers can skip
+    the broadcast entirely. Clients that negotiated deltas receive GAME_DELTA
+    frames holding only the fields that differ from the last version written
+    to their socket; everyone gets a full snapshot every full_interval
+    versions or when their base is no longer in history.
+    """
+
+    def __init__(self, full_interval=50, history=64):
+        self.full_interval = full_interval
+        self.history_size = history
+        self.history = OrderedDict()  # {version: state tuple}
+        self.version = 0
+        self.state = None
+        self.frames = {}  # {(base, protocol): bytes} for the current version
+
+    def publish(self, state):
+        """state: tuple in STATE_FIELDS order"""
+        if state == self.state:
+            return None
+        self.version += 1
+        self.state = state
+        self.history[self.version] = state
+        if len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+        self.frames = {}
+        return self.version
+
+    def full_frame(self, protocol):
+        """Plain GAME_UPDATE for clients without delta support"""
+        key = (None, protocol)
+        data = self.frames.get(key)
+        if data is None:
+            message = {'command': 'GAME_UPDATE'}
+            message.update(zip(STATE_FIELDS, self.state))
+            data = self.frames[key] = encode(message, protocol)
+        return data
+
+    def delta_frame(self, base, protocol):
+        """GAME_DELTA against base (the version the client already has)"""
+        if base not in self.history or self.version % self.full_interval == 0:
+            base = 0
+        key = (base, protocol)
+        data = self.frames.get(key)
+        if data is None:
+            message = {'command': 'GAME_DELTA', 'version': self.version, 'base': base}
+            if base:
+                old = self.history[base]
+                message.update((name, new) for name, new, prev in zip(STATE_FIELDS, self.state, old) if new != prev)
+            else:
+                message.update(zip(STATE_FIELDS, self.state))
+            data = self.frames[key] = encode(message, protocol)
+        return data
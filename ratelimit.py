@@ -0,0 +1,176 @@
+"""Per-connection flood protection for the game port.
+
+Every connection gets a RateLimiter with one token bucket per message class:
+
+  press   PRESS, PRESS_LEFT, PRESS_RIGHT; counted in presses, so a PRESS
+          message costs its count (up to MAX_PRESS_COUNT tokens)
+  start   START_GAME (each one rescans the room and broadcasts)
+  other   JOIN_GAME and anything else
+
+FrameDecoder asks the limiter before decoding: binary frames are classified
+by their type byte, JSON (lines or T_JSON frames) by a regex on the
+"command" value, so a message over the limit is dropped without ever being
+parsed or reaching a room. A decoded JSON command whose class the regex did
+not see (escaped, or a repeated "command" key) is charged to its own bucket
+as well. JSON lines longer than MAX_LINE are thrown away.
+
+A connection that keeps getting dropped (disconnect_after drops within
+FLOOD_WINDOW seconds) is marked as an offender and the engine closes it.
+Drops are counted per class in /metrics.
+"""
+import re
+import time
+
+from metrics import metrics, RATE_LIMITED, FLOOD_DISCONNECTS
+from protocol import (MAX_PRESS_COUNT, FrameDecoder, press_count, T_JSON, T_PRESS, T_PRESS_LEFT, T_PRESS_RIGHT,
+                      T_START_GAME)
+
+# per second and burst size, per connection (press: presses, others: messages)
+DEFAULT_LIMITS = {
+    # A player mashing a key manages 10-15 presses a second; the burst stays well under the 50
+    # presses that win a round from the centre, but holds one full PRESS message (MAX_PRESS_COUNT)
+    'press': (20.0, 20.0),
+    'start': (1.0, 3.0),
+    'other': (5.0, 10.0),
+}
+FRAME_CLASSES = {T_PRESS: 'press', T_PRESS_LEFT: 'press', T_PRESS_RIGHT: 'press', T_START_GAME: 'start'}
+COMMAND_CLASSES = {'PRESS': 'press', 'PRESS_LEFT': 'press', 'PRESS_RIGHT': 'press', 'START_GAME': 'start'}
+COMMAND_RE = re.compile(rb'"command"\s*:\s*"(START_GAME|PRESS(?:_LEFT|_RIGHT)?)"')
+LINE_CLASSES = {name.encode(): cls for name, cls in COMMAND_CLASSES.items()}
+FLOOD_WINDOW = 10.0  # seconds
+MAX_LINE = 8192  # longest JSON line accepted from a client
+
+
+def line_class(line):
+    """Message class of a raw JSON line, from its "command" value, without parsing it"""
+    commands = COMMAND_RE.findall(line)
+    if not commands:
+        return 'other'
+    if b'START_GAME' in commands:
+        return 'start'
+    return LINE_CLASSES[commands[0]]
+
+
+class FloodPolicy:
+    """Limits shared by every connection of this process"""
+
+    def __init__(self):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.disconnect_after = 300  # drops per FLOOD_WINDOW; 0 never disconnects
+
+    def apply_options(self, limits=(), disconnect_after=None):
+        """limits: ['press=50', 'start=1/3', ...] (messages per second, optional /burst)"""
+        for spec in limits:
+            name, _, value = spec.partition('=')
+            if name not in self.limits:
+                raise ValueError(f"unknown message class {name!r} (expected one of {', '.join(self.limits)})")
+            rate, _, burst = value.partition('/')
+            rate = float(rate)
+            burst = float(burst) if burst else max(1.0, 2 * rate)
+            if name == 'press':
+                burst = max(burst, float(MAX_PRESS_COUNT))  # a full PRESS message must fit
+            self.limits[name] = (rate, burst)
+        if disconnect_after is not None:
+            self.disconnect_after = disconnect_after
+
+    def limiter(self, name):
+        return RateLimiter(self, name)
+
+    def decoder(self, name, on_error=None):
+        """FrameDecoder for a new client connection, with its own limiter"""
+        return FrameDecoder(name, on_error=on_error, limiter=self.limiter(name), max_line=MAX_LINE)
+
+
+class TokenBucket:
+    __slots__ = ('cls', 'rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, cls, rate, burst, now):
+        self.cls = cls
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now, n=1):
+        """Spend n tokens; False (and nothing spent) when the bucket holds fewer"""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamp = now
+        if tokens >= n:
+            self.tokens = tokens - n
+            return True
+        self.tokens = tokens
+        return False
+
+
+class RateLimiter:
+    """Token buckets of one connection"""
+
+    def __init__(self, policy, name):
+        self.disconnect_after = policy.disconnect_after
+        self.name = name
+        now = time.monotonic()
+        self.buckets = {cls: TokenBucket(cls, rate, burst, now) for cls, (rate, burst) in policy.limits.items()}
+        # Resolved once per connection: the hot path is one dict lookup and take()
+        self.frame_buckets = {msg_type: self.buckets[cls] for msg_type, cls in FRAME_CLASSES.items()}
+        self.dropped = dict.fromkeys(RATE_LIMITED, 0)
+        self.window_start = now
+        self.window_drops = 0
+        self.offender = False
+        self.last_class = None  # class charged for the last JSON message, see allow_decoded()
+
+    def allow(self, cls, now, n=1):
+        bucket = self.buckets[cls]
+        if bucket.take(now, n):
+            return True
+        self.drop(cls, now)
+        return False
+
+    def allow_frame(self, msg_type, payload, now):
+        bucket = self.frame_buckets.get(msg_type)
+        if bucket is None:
+            return self.allow_line(payload, now) if msg_type == T_JSON else self.allow('other', now)
+        n = 1
+        if msg_type == T_PRESS and len(payload) >= 3:
+            # PRESS payload: direction u8, count u16 (clamped by the room like press_count())
+            n = min(max((payload[1] << 8) | payload[2], 1), MAX_PRESS_COUNT)
+        if bucket.take(now, n):
+            return True
+        self.drop(bucket.cls, now)
+        return False
+
+    def allow_line(self, line, now):
+        cls = self.last_class = line_class(line)
+        return self.allow(cls, now)
+
+    def allow_decoded(self, message, now):
+        """Second look at a decoded JSON message.
+
+        Charges a command line_class() missed to its own bucket, and the rest
+        of a PRESS message's count (allow_line() took one token for it).
+        """
+        command = message.get('command') if isinstance(message, dict) else None
+        cls = COMMAND_CLASSES.get(command) if isinstance(command, str) else None
+        if cls is None:
+            return True
+        n = max(press_count(message), 1) if command == 'PRESS' else 1
+        if cls == self.last_class:
+            n -= 1
+        if n <= 0:
+            return True
+        return self.allow(cls, now, n)
+
+    def drop(self, cls, now):
+        self.dropped[cls] += 1
+        metrics.inc(RATE_LIMITED[cls])
+        if now - self.window_start >= FLOOD_WINDOW:
+            self.window_start = now
+            self.window_drops = 0
+        self.window_drops += 1
+        if self.disconnect_after and self.window_drops >= self.disconnect_after and not self.offender:
+            self.offender = True
+            metrics.inc(FLOOD_DISCONNECTS)
+
+
+flood = FloodPolicy()
@@ -0,0 +1,69 @@
+from protocol import JSON
+
+TEAMS = ('left', 'right')
+
+
+class ClientRecord:
+    """Everything the game server keeps per connected player"""
+
+    __slots__ = ('client_id', 'socket', 'team', 'outbox', 'protocol', 'deltas', 'evicted', 'name')
+
+    def __init__(self, client_id, socket, outbox, protocol=JSON, deltas=False, name=None):
+        self.client_id = client_id
+        self.name = name  # player name from JOIN_GAME, for match stats (None: anonymous)
+        self.socket = socket
+        self.team = None
+        self.outbox = outbox
+        self.protocol = protocol
+        self.deltas = deltas
+        self.evicted = False
+
+
+class ClientRegistry:
+    """Client records indexed by id and by team; join, leave and team counts are O(1)"""
+
+    def __init__(self):
+        self.records = {}  # {client_id: ClientRecord}
+        self.teams = {team: set() for team in TEAMS}  # {team: {client_id}}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, client_id):
+        return client_id in self.records
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def get(self, client_id):
+        return self.records.get(client_id)
+
+    def counts(self):
+        return len(self.teams['left']), len(self.teams['right'])
+
+    def next_team(self):
+        """Team with fewer players, or alternate if equal"""
+        left_count, right_count = self.counts()
+        if left_count < right_count:
+            return 'left'
+        if right_count < left_count:
+            return 'right'
+        # If equal, alternate based on total client count
+        return 'left' if len(self.records) % 2 == 0 else 'right'
+
+    def add(self, record):
+        record.team = self.next_team()
+        self.records[record.client_id] = record
+        self.teams[record.team].add(record.client_id)
+        return record.team
+
+    def add_batch(self, records):
+        """Assign teams for a burst of joins; same result as adding them one by one"""
+        for record in records:
+            self.add(record)
+
+    def remove(self, client_id):
+        record = self.records.pop(client_id, None)
+        if record is not None:
+            self.teams[record.team].discard(client_id)
+        return record
@@ -0,0 +1,245 @@
+"""Cached, dirty-rectangle renderer for the pygame client.
+
+Fonts, the static background (title, bar, help lines) and rendered text are
+created once and reused. Each frame the screen is described as a set of
+elements (team counts, bar, timer, ...), each keyed by what it shows; only
+elements whose key changed are redrawn, over the background, and only their
+rectangles are sent to the display. A frame where the client state did not
+change at all is skipped after a single tuple comparison.
+
+F3 toggles an overlay with frame time, draw time and the renderer counters.
+"""
+import time
+from collections import deque
+
+import pygame
+
+FONT_SIZES = {'large': 48, 'medium': 36, 'small': 24, 'tiny': 20}
+MAX_TEXTS = 256  # cached text surfaces; the cache is emptied when it grows past this
+
+BACKGROUND = (30, 30, 50)
+WHITE = (255, 255, 255)
+LEFT_COLOR = (255, 100, 100)
+RIGHT_COLOR = (100, 100, 255)
+YELLOW = (255, 255, 0)
+
+BAR_WIDTH, BAR_HEIGHT, BAR_Y = 500, 40, 250
+INDICATOR_RADIUS = 20
+# y of the centered labels
+ROWS = {'team': 100, 'position': BAR_Y + BAR_HEIGHT + 10, 'timer': 350, 'controls': 400, 'status': 450}
+OVERLAY_REFRESH = 0.25  # seconds between overlay updates, so it does not dirty every frame
+
+
+class Renderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.width, self.height = screen.get_size()
+        self.bar_x = (self.width - BAR_WIDTH) // 2
+        # The indicator may stick out of the bar by its radius on either end
+        self.bar_rect = pygame.Rect(self.bar_x - INDICATOR_RADIUS - 1, BAR_Y - 1,
+                                    BAR_WIDTH + 2 * INDICATOR_RADIUS + 2, BAR_HEIGHT + 2)
+        self.fonts = {name: pygame.font.Font(None, size) for name, size in FONT_SIZES.items()}
+        self.texts = {}  # {(font, text, color): Surface}
+        self.backgrounds = {}  # {connected: Surface}
+        self.background = None  # background currently on screen
+        self.drawn = {}  # {element: (key, Rect)} currently on screen
+        self.snapshot = None  # client state the screen shows
+        self.show_overlay = False
+        self.overlay_lines = None
+        self.overlay_at = 0.0
+        self.frame_times = deque(maxlen=120)  # ms between frames, from the main loop's clock
+        self.draw_ms = 0.0  # smoothed time spent in draw()
+        self.stats = {'frames': 0, 'skipped': 0, 'redrawn': 0, 'full': 0, 'rects': 0, 'elements': 0,
+                      'text_hits': 0, 'text_misses': 0}
+
+    def invalidate(self):
+        """Repaint everything on the next frame (e.g. the window was uncovered)"""
+        self.background = None
+        self.snapshot = None
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.overlay_lines = None
+        self.snapshot = None
+
+    # -- cached surfaces ------------------------------------------------------
+
+    def text(self, font, text, color):
+        key = (font, text, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            self.stats['text_misses'] += 1
+            if len(self.texts) >= MAX_TEXTS:
+                self.texts.clear()
+            surface = self.texts[key] = self.fonts[font].render(text, True, color).convert_alpha()
+        else:
+            self.stats['text_hits'] += 1
+        return surface
+
+    def get_background(self, connected):
+        surface = self.backgrounds.get(connected)
+        if surface is None:
+            surface = pygame.Surface((self.width, self.height)).convert()
+            surface.fill(BACKGROUND)
+            if connected:
+                self.paint_static(surface)
+            else:
+                error = self.text('large', "DISCONNECTED FROM SERVER", (255, 0, 0))
+                surface.blit(error, (self.width // 2 - error.get_width() // 2, self.height // 2))
+            self.backgrounds[connected] = surface
+        return surface
+
+    def paint_static(self, surface):
+        """Everything that never changes while connected"""
+        self.blit_centered(surface, self.text('large', "TUG OF WAR DIGITAL", WHITE), 50)
+
+        pygame.draw.rect(surface, (100, 100, 100), (self.bar_x, BAR_Y, BAR_WIDTH, BAR_HEIGHT))
+        for color, x in ((LEFT_COLOR, self.bar_x), (RIGHT_COLOR, self.bar_x + BAR_WIDTH // 2)):
+            zone = pygame.Surface((BAR_WIDTH // 2, BAR_HEIGHT))
+            zone.fill(color)
+            zone.set_alpha(100)
+            surface.blit(zone, (x, BAR_Y))
+
+        self.blit_centered(surface, self.text('small', "Tekan SPACE untuk memulai permainan baru",
+                                              (200, 200, 200)), 520)
+        self.blit_centered(surface, self.text('small', "Kontrol: A = Kiri, D = Kanan, SPACE = Mulai Game",
+                                              (150, 150, 150)), 550)
+
+    def blit_centered(self, surface, text, y):
+        return surface.blit(text, (self.width // 2 - text.get_width() // 2, y))
+
+    # -- elements ---------------------------------------------------------------
+
+    def layout(self, client):
+        """{element: (key, painter)}: what should be on screen now, keyed by its content"""
+        data = client.game_data
+        elements = {}
+
+        def label(name, font, text, color, pos=None):
+            """Text at pos, or centered horizontally at the element's row"""
+            if pos is None:
+                y = ROWS[name]
+                paint = lambda: self.blit_centered(self.screen, self.text(font, text, color), y)
+            else:
+                paint = lambda: self.screen.blit(self.text(font, text, color), pos)
+            elements[name] = ((font, text, color, pos), paint)
+
+        if client.my_team:
+            label('team', 'medium', f"TIM ANDA: {client.my_team.upper()}",
+                  LEFT_COLOR if client.my_team == 'left' else RIGHT_COLOR)
+        label('left', 'medium', f"TIM KIRI ({data['left_count']})", LEFT_COLOR, (100, 150))
+        label('right', 'medium', f"TIM KANAN ({data['right_count']})", RIGHT_COLOR, (self.width - 250, 150))
+
+        # Predicted and interpolated, see prediction.py
+        indicator_x = self.indicator_x(client.bar.value())
+        elements['bar'] = (indicator_x, lambda: self.paint_bar(indicator_x))
+
+        label('position', 'small', f"Posisi: {client.bar.predicted()}", WHITE)
+        label('timer', 'medium', f"Timer: {data['timer']}", WHITE if data['timer'] > 10 else (255, 0, 0))
+
+        if client.my_team and data['game_active']:
+            if client.my_team == 'left':
+                label('controls', 'small', "Tekan 'A' untuk menarik ke kiri!", LEFT_COLOR)
+            else:
+                label('controls', 'small', "Tekan 'D' untuk menarik ke kanan!", RIGHT_COLOR)
+
+        if data['winner']:
+            label('status', 'large', f"TIM {data['winner']} MENANG!", YELLOW)
+        elif not data['game_active']:
+            if data['left_count'] == 0 or data['right_count'] == 0:
+                label('status', 'medium', "Menunggu pemain di kedua tim...", WHITE)
+            else:
+                label('status', 'medium', "Menunggu permainan dimulai...", WHITE)
+        return elements
+
+    def indicator_x(self, position):
+        pos_ratio = max(0, min(1, (position + 50) / 100))
+        return int(self.bar_x + pos_ratio * BAR_WIDTH)
+
+    def paint_bar(self, indicator_x):
+        center_x = self.bar_x + BAR_WIDTH // 2
+        pygame.draw.circle(self.screen, YELLOW, (indicator_x, BAR_Y + BAR_HEIGHT // 2), INDICATOR_RADIUS)
+        pygame.draw.line(self.screen, WHITE, (center_x, BAR_Y), (center_x, BAR_Y + BAR_HEIGHT), 3)
+        return self.bar_rect
+
+    def overlay(self):
+        now = time.perf_counter()
+        if self.overlay_lines is None or now - self.overlay_at >= OVERLAY_REFRESH:
+            self.overlay_at = now
+            times = self.frame_times or [0.0]
+            average = sum(times) / len(times)
+            stats = self.stats
+            self.overlay_lines = (
+                f"frame {average:.1f} ms avg / {max(times):.1f} max ({1000 / average if average else 0:.0f} fps)",
+                f"draw {self.draw_ms:.2f} ms, redrawn {stats['redrawn']}/{stats['frames']} frames, "
+                f"{stats['rects']} rects",
+                f"text cache {len(self.texts)} ({stats['text_hits']} hits, {stats['text_misses']} misses)",
+            )
+        lines = self.overlay_lines
+
+        def paint():
+            # Rendered directly: the numbers change too often to be worth caching
+            rect = None
+            for i, line in enumerate(lines):
+                text = self.fonts['tiny'].render(line, True, (0, 255, 0))
+                drawn = self.screen.blit(text, (5, 5 + i * 16))
+                rect = drawn if rect is None else rect.union(drawn)
+            return rect
+        return lines, paint
+
+    # -- frame ------------------------------------------------------------------
+
+    def draw(self, client, frame_ms=0.0):
+        """Bring the screen up to date with client; returns the number of rectangles updated"""
+        started = time.perf_counter()
+        self.frame_times.append(frame_ms)
+        self.stats['frames'] += 1
+
+        snapshot = (client.connected, client.my_team, tuple(client.game_data.values()),
+                    self.indicator_x(client.bar.value()), client.bar.predicted())
+        if snapshot == self.snapshot and not (
+                self.show_overlay and started - self.overlay_at >= OVERLAY_REFRESH):
+            self.stats['skipped'] += 1
+            return 0
+        self.snapshot = snapshot
+
+        connected = client.connected
+        elements = self.layout(client) if connected else {}
+        if self.show_overlay:
+            elements['overlay'] = self.overlay()
+
+        background = self.get_background(connected)
+        full = background is not self.background
+        if full:
+            self.screen.blit(background, (0, 0))
+            self.background = background
+            self.drawn = {}
+
+        rects = []
+        for name in [n for n in self.drawn if n not in elements]:
+            _, rect = self.drawn.pop(name)
+            self.screen.blit(background, rect, rect)
+            rects.append(rect)
+        for name, (key, paint) in elements.items():
+            old = self.drawn.get(name)
+            if old is not None:
+                if old[0] == key:
+                    continue
+                self.screen.blit(background, old[1], old[1])
+                rects.append(old[1])
+            rect = paint()
+            self.drawn[name] = (key, rect)
+            rects.append(rect)
+            self.stats['elements'] += 1
+
+        if full:
+            pygame.display.flip()
+            self.stats['full'] += 1
+        elif rects:
+            pygame.display.update(rects)
+        if full or rects:
+            self.stats['redrawn'] += 1
+            self.stats['rects'] += len(rects)
+
+        self.draw_ms += ((time.perf_counter() - started) * 1000 - self.draw_ms) * 0.1
+        return len(rects)
@@ -0,0 +1,152 @@
+"""Replay a match journal through a real TugOfWarGameServer room.
+
+    python replay.py matches/default-20260101-120000-4242-0001.towj
+    python replay.py --speed 10 matches/*.towj     ten times faster than real time
+    python replay.py --dump matches/kelas-a-....towj
+
+Every record is turned back into what the room originally received (joins,
+leaves, PRESS commands, game seconds and ticks) and handled by the room's
+actor code on this thread, so the journaled match is played through the same
+game logic the server runs. --speed 0 (the default) does not wait at all.
+
+Each record also holds the bar position the server had at that moment;
+the replay compares it with its own room and reports where they diverge,
+which points at a behaviour change (or a bug) between the two versions.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from game_log import events
+from http_server import TugOfWarGameServer
+from journal import JournalReader, KINDS, ROSTER, JOIN, LEAVE, PRESS, SECOND, TICK, END, WINNERS
+from registry import ClientRecord
+
+DIRECTIONS = {-1: 'left', 1: 'right'}
+WINNER_NAMES = {code: name for name, code in WINNERS.items()}
+
+
+class NullOutbox:
+    """Outbox that only counts frames: nobody is connected during a replay"""
+
+    evicted = False
+    coalesced = 0
+
+    def __init__(self):
+        self.frames = 0
+
+    def __len__(self):
+        return 0
+
+    def put(self, frame, kind=None):
+        self.frames += 1
+        return True
+
+    def put_state(self, version, make_frame):
+        self.frames += 1
+        return True
+
+    def close(self):
+        pass
+
+
+def replay(path, speed=0.0):
+    """Play one journal through a fresh room; returns a summary dict"""
+    with JournalReader(path) as reader:
+        room = TugOfWarGameServer(reader.room_id, tick_rate=reader.tick_rate)
+        outboxes = {}
+        divergences = []
+        counts = dict.fromkeys(KINDS.values(), 0)
+        end = None
+        started = time.monotonic()
+
+        for t_ms, kind, team, count, client, position in reader.records():
+            if speed:
+                delay = started + t_ms / 1000.0 / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if room.game_state.bar_position != position and len(divergences) < 20:
+                divergences.append({'t_ms': t_ms, 'record': KINDS[kind], 'journal': position,
+                                    'replay': room.game_state.bar_position})
+            counts[KINDS[kind]] += 1
+            client_id = f"client-{client}"
+
+            if kind == ROSTER:
+                # Players already in the room when the match started keep their recorded team
+                record = ClientRecord(client_id, None, outboxes.setdefault(client_id, NullOutbox()))
+                record.team = DIRECTIONS[team]
+                room.clients.records[client_id] = record
+                room.clients.teams[record.team].add(client_id)
+            elif kind == JOIN:
+                room.add_client(client_id, None, outboxes.setdefault(client_id, NullOutbox()))
+            elif kind == LEAVE:
+                room.remove_client(client_id)
+            elif kind == PRESS:
+                room.handle_command(client_id, {'command': 'PRESS', 'direction': DIRECTIONS[team], 'count': count})
+            elif kind == SECOND:
+                room.second()
+            elif kind == TICK:
+                room.tick()
+            elif kind == END:
+                end = WINNER_NAMES.get(team)
+            room.actor.drain()
+
+        elapsed = time.monotonic() - started
+        room.stop()
+        duration = reader.duration()
+        return {
+            'journal': path,
+            'room': reader.room_id,
+            'tick_rate': reader.tick_rate,
+            'records': len(reader),
+            'counts': counts,
+            'match_seconds': duration,
+            'replay_seconds': round(elapsed, 4),
+            'speedup': round(duration / elapsed, 1) if elapsed else None,
+            'journal_winner': end,
+            'replay_winner': room.game_state.winner,
+            'final_position': room.game_state.bar_position,
+            'frames_sent': sum(outbox.frames for outbox in outboxes.values()),
+            'divergences': divergences,
+        }
+
+
+def dump(path):
+    with JournalReader(path) as reader:
+        print(f"# room {reader.room_id}, tick rate {reader.tick_rate}, started "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.started))}, {len(reader)} records")
+        for t_ms, kind, team, count, client, position in reader.records():
+            print(f"{t_ms:>8} {KINDS[kind]:<7} team={team:+d} count={count} client={client} position={position}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay Tug of War match journals')
+    parser.add_argument('journals', nargs='+', help='.towj files written with --journal-dir')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='replay speed relative to the recording (0 = as fast as possible)')
+    parser.add_argument('--dump', action='store_true', help='print the records instead of replaying')
+    args = parser.parse_args()
+
+    events.level = logging.CRITICAL  # the replayed room would log every press again
+
+    failed = 0
+    for path in args.journals:
+        if args.dump:
+            dump(path)
+            continue
+        result = replay(path, args.speed)
+        match = result['journal_winner'] is None or result['journal_winner'] == result['replay_winner']
+        ok = match and not result['divergences']
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {path}: {result['records']} records, {result['match_seconds']:.1f}s match "
+              f"replayed in {result['replay_seconds']:.3f}s ({result['speedup']}x), "
+              f"winner {result['journal_winner']} -> {result['replay_winner']}, "
+              f"position {result['final_position']}")
+        for d in result['divergences']:
+            print(f"   at {d['t_ms']} ms ({d['record']}): journal {d['journal']}, replay {d['replay']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
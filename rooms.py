@@ -0,0 +1,206 @@
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+import zlib
+
+from game_log import events
+from metrics import metrics, ROOMS
+from protocol import join_options
+
+DEFAULT_ROOM = 'default'
+
+
+def room_from_command(command):
+    """Room id requested by a JOIN_GAME message (anything else joins the default room)"""
+    if command.get('command') == 'JOIN_GAME' and command.get('room'):
+        return str(command['room'])[:32]
+    return DEFAULT_ROOM
+
+
+class RoomManager:
+    """Independent matches keyed by room id, each with its own GameState, teams, actor and game clock"""
+
+    def __init__(self, room_factory):
+        self.room_factory = room_factory  # room_id -> TugOfWarGameServer
+        self.rooms = {}
+        self.members = {}  # {room_id: connections joined or joining}
+        self.lock = threading.Lock()
+        self.get(DEFAULT_ROOM)
+
+    def get(self, room_id):
+        with self.lock:
+            return self._get(room_id)
+
+    def _get(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.room_factory(room_id)
+            self.rooms[room_id] = room
+            self.members[room_id] = 0
+            metrics.inc(ROOMS)
+            room.start()
+            if room_id != DEFAULT_ROOM:
+                events.event('game', "Room {} created ({} rooms)", room_id, len(self.rooms))
+        return room
+
+    def new_outbox(self):
+        """Outbound queue for a connection that has not picked a room yet"""
+        return self.rooms[DEFAULT_ROOM].new_outbox()
+
+    def join(self, client_id, socket, outbox, command):
+        """Put a connection into the room its first command asks for"""
+        room_id = room_from_command(command)
+        with self.lock:
+            room = self._get(room_id)
+            # Counted before add_client so the room cannot be reaped in between
+            self.members[room_id] += 1
+        room.add_client(client_id, socket, outbox, **join_options(command))
+        return room
+
+    def leave(self, room, client_id):
+        room.remove_client(client_id)
+        with self.lock:
+            self.members[room.room_id] -= 1
+            if self.members[room.room_id] <= 0 and room.room_id != DEFAULT_ROOM:
+                room.stop()
+                del self.rooms[room.room_id]
+                del self.members[room.room_id]
+                metrics.dec(ROOMS)
+                events.event('game', "Room {} closed ({} rooms)", room.room_id, len(self.rooms))
+
+    def stop(self):
+        with self.lock:
+            rooms = list(self.rooms.values())
+        for room in rooms:
+            room.stop()
+        # Let every actor finish what was posted before it (e.g. the last journal records)
+        for room in rooms:
+            room.actor.join(1.0)
+
+    def close(self):
+        """Stop and forget every room (the dispatcher process hosts none)"""
+        self.stop()
+        with self.lock:
+            metrics.dec(ROOMS, len(self.rooms))
+            self.rooms.clear()
+            self.members.clear()
+
+
+def worker_for_room(room_id, workers):
+    """Stable room -> worker mapping (crc32, so it does not depend on PYTHONHASHSEED)"""
+    return zlib.crc32(room_id.encode()) % workers
+
+
+def hand_off(channel, connection, address, initial):
+    """Pass an accepted socket plus the bytes already read from it to a worker process"""
+    payload = json.dumps({'address': list(address), 'initial': initial.decode('latin-1')}).encode()
+    socket.send_fds(channel, [payload], [connection.fileno()])
+    connection.close()
+
+
+def receive_handoffs(channel, handler):
+    """Worker side of hand_off: call handler(connection, address, initial) for each socket"""
+    while True:
+        try:
+            payload, fds, _, _ = socket.recv_fds(channel, 65536, 1)
+        except OSError:
+            break
+        if not payload:
+            break
+        info = json.loads(payload)
+        connection = socket.socket(fileno=fds[0])
+        handler(connection, tuple(info['address']), info['initial'].encode('latin-1'))
+
+
+class ConnectionDispatcher:
+    """Accepts game connections and routes each to the worker that owns its room.
+
+    The first line a client sends is its JOIN_GAME; it is read without
+    blocking (one selector for every pending socket), hashed to a worker and
+    handed over together with any bytes read past it.
+    """
+
+    def __init__(self, channels, port=55555, host='0.0.0.0', join_timeout=5.0):
+        self.channels = channels  # one AF_UNIX datagram socket per worker
+        self.port = port
+        self.host = host
+        self.join_timeout = join_timeout
+        self.pending = {}  # {socket: [address, data, accepted_at]}
+        self.running = True
+
+    def serve_forever(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(1024)
+        listener.setblocking(False)
+
+        sel = selectors.DefaultSelector()
+        sel.register(listener, selectors.EVENT_READ)
+        print(f"🎮 Game dispatcher listening on port {self.port} ({len(self.channels)} workers)")
+
+        try:
+            while self.running:
+                for key, _ in sel.select(timeout=1.0):
+                    if key.fileobj is listener:
+                        self.accept(listener, sel)
+                    else:
+                        self.read_join(key.fileobj, sel)
+                self.expire(sel)
+        finally:
+            sel.close()
+            listener.close()
+
+    def accept(self, listener, sel):
+        try:
+            while True:
+                connection, address = listener.accept()
+                connection.setblocking(False)
+                self.pending[connection] = [address, b"", time.monotonic()]
+                sel.register(connection, selectors.EVENT_READ)
+        except BlockingIOError:
+            pass
+
+    def read_join(self, connection, sel):
+        entry = self.pending[connection]
+        try:
+            data = connection.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            sel.unregister(connection)
+            del self.pending[connection]
+            connection.close()
+            return
+        entry[1] += data
+        if b'\n' in entry[1] or len(entry[1]) >= 4096:
+            self.dispatch(connection, sel)
+
+    def expire(self, sel):
+        now = time.monotonic()
+        for connection, entry in list(self.pending.items()):
+            if now - entry[2] > self.join_timeout:
+                self.dispatch(connection, sel)
+
+    def dispatch(self, connection, sel):
+        address, data, _ = self.pending.pop(connection)
+        sel.unregister(connection)
+        room_id = DEFAULT_ROOM
+        line = data.split(b'\n', 1)[0].strip()
+        if line:
+            try:
+                room_id = room_from_command(json.loads(line))
+            except (ValueError, AttributeError):
+                pass
+        worker = worker_for_room(room_id, len(self.channels))
+        connection.setblocking(True)
+        try:
+            hand_off(self.channels[worker], connection, address, data)
+        except OSError as e:
+            logging.warning(f"Failed to hand off {address} to worker {worker}: {e}")
+            connection.close()
@@ -0,0 +1,256 @@
+"""Central timer service: one thread and a hierarchical timer wheel.
+
+Everything in the game server that used to sleep, spawn a threading.Timer or
+lean on a socket timeout is a timer here: round seconds, simulation ticks,
+the auto-restart delay and per-connection ping/idle watchdogs. Timers are
+kept in a hierarchical timing wheel (Varghese & Lauck): adding or cancelling
+one is O(1) however many are pending, and expired timers are collected by
+moving through the wheel instead of sorting a heap.
+
+Deadlines come from time.monotonic(). Periodic timers are scheduled from their
+previous deadline, not from when the callback finished, so a slow callback
+does not make them drift; if one falls a whole interval behind, the missed
+runs are skipped instead of fired back to back.
+
+Callbacks run one at a time on the scheduler thread and should be short
+(post a message to a room actor, queue a frame); anything that blocks delays every
+other timer.
+"""
+import logging
+import threading
+import time
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS  # slots per level
+LEVELS = 4  # 64**4 ticks: ~4.6 hours at 1 ms; later deadlines wait in an overflow list
+
+
+class Timer:
+    __slots__ = ('tick', 'callback', 'args', 'interval', 'deadline', 'cancelled')
+
+    def __init__(self, deadline, callback, args, interval=None):
+        self.deadline = deadline  # monotonic seconds
+        self.tick = 0  # deadline in wheel ticks, set by the wheel
+        self.callback = callback
+        self.args = args
+        self.interval = interval  # seconds between runs, None for a one-shot timer
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the timer; safe from any thread, also from its own callback"""
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hierarchical timing wheel with a fixed resolution (not thread-safe).
+
+    Level 0 has one slot per tick; each higher level has slots SLOTS times
+    wider. A timer goes into the lowest level whose range covers its delay
+    and is moved down ("cascaded") when the level below wraps around to it.
+    Cancelled timers are dropped lazily when their slot comes up.
+    """
+
+    def __init__(self, resolution=0.001, start=None):
+        self.resolution = resolution
+        self.start = time.monotonic() if start is None else start
+        self.current = 0  # last tick processed
+        self.levels = [[[] for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow = []
+        self.count = 0  # timers in the wheel, cancelled ones included
+
+    def __len__(self):
+        return self.count
+
+    def to_tick(self, when):
+        # Round up: a timer never fires before its deadline
+        return max(0, -int((self.start - when) // self.resolution))
+
+    def add(self, timer):
+        timer.tick = max(self.to_tick(timer.deadline), self.current + 1)
+        self.count += 1
+        self.place(timer)
+
+    def place(self, timer):
+        delta = timer.tick - self.current
+        for level in range(LEVELS):
+            if delta < SLOTS << (SLOT_BITS * level):
+                slot = (timer.tick >> (SLOT_BITS * level)) & (SLOTS - 1)
+                self.levels[level][slot].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def next_tick(self):
+        """Tick at which advance() must run next, None when the wheel is empty.
+
+        That is the earliest occupied level 0 slot or, for a higher level, the
+        tick where its earliest occupied slot is cascaded; empty stretches of
+        the wheel are skipped in one step.
+        """
+        if not self.count:
+            return None
+        best = None
+        for level in range(LEVELS):
+            shift = SLOT_BITS * level
+            base = self.current >> shift
+            slots = self.levels[level]
+            for k in range(1, SLOTS + 1):
+                if slots[(base + k) & (SLOTS - 1)]:
+                    tick = (base + k) << shift
+                    if best is None or tick < best:
+                        best = tick
+                    break
+        if self.overflow:
+            tick = ((self.current >> (SLOT_BITS * LEVELS)) + 1) << (SLOT_BITS * LEVELS)
+            if best is None or tick < best:
+                best = tick
+        return best
+
+    def advance(self, now):
+        """Process every tick up to now; returns the timers that expired"""
+        target = int((now - self.start) // self.resolution)
+        expired = []
+        wheel = self.levels[0]
+        while self.current < target and self.count:
+            tick = self.next_tick()
+            if tick > target:
+                # Nothing is due or cascades before target
+                self.current = target
+                break
+            self.current = tick
+            if tick & (SLOTS - 1) == 0:
+                self.cascade(1)
+            slot = wheel[tick & (SLOTS - 1)]
+            if slot:
+                wheel[tick & (SLOTS - 1)] = []
+                self.count -= len(slot)
+                expired.extend(t for t in slot if not t.cancelled)
+        if not self.count:
+            self.current = max(self.current, target)
+        return expired
+
+    def cascade(self, level):
+        if level == LEVELS:
+            timers, self.overflow = self.overflow, []
+        else:
+            index = (self.current >> (SLOT_BITS * level)) & (SLOTS - 1)
+            if index == 0:
+                self.cascade(level + 1)
+            timers = self.levels[level][index]
+            self.levels[level][index] = []
+        for timer in timers:
+            if timer.cancelled:
+                self.count -= 1
+            else:
+                self.place(timer)
+
+
+class Watchdog:
+    """Idle timer for one connection.
+
+    touch() only records the time: the timer is not moved on every read. When
+    it fires and the connection has been quiet for the whole interval,
+    on_idle() runs; otherwise it is re-armed for the remaining time.
+    """
+
+    def __init__(self, scheduler, interval, on_idle):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.on_idle = on_idle
+        self.last_seen = time.monotonic()
+        self.cancelled = False
+        self.timer = scheduler.call_at(self.last_seen + interval, self.check)
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def check(self):
+        if self.cancelled:
+            return
+        now = time.monotonic()
+        if now - self.last_seen >= self.interval:
+            self.last_seen = now
+            self.on_idle()
+        if self.cancelled:
+            return
+        self.timer = self.scheduler.call_at(self.last_seen + self.interval, self.check)
+        # cancel() may have run on another thread while the new timer was being armed
+        if self.cancelled:
+            self.timer.cancel()
+
+    def cancel(self):
+        self.cancelled = True
+        self.timer.cancel()
+
+
+class Scheduler:
+    def __init__(self, resolution=0.001):
+        self.wheel = TimerWheel(resolution)
+        self.cond = threading.Condition()
+        self.thread = None
+        self.wake_tick = None  # tick the thread sleeps until (None: no timers, -1: busy firing)
+        self.late_runs = 0  # periodic runs skipped because the callback fell behind
+
+    def call_at(self, deadline, callback, *args):
+        return self.add(Timer(deadline, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) once, delay seconds from now"""
+        return self.add(Timer(time.monotonic() + delay, callback, args))
+
+    def call_every(self, interval, callback, *args, first=None):
+        """Run callback(*args) every interval seconds (first run after first, default interval)"""
+        start = time.monotonic() + (interval if first is None else first)
+        return self.add(Timer(start, callback, args, interval))
+
+    def watchdog(self, interval, on_idle):
+        return Watchdog(self, interval, on_idle)
+
+    def add(self, timer):
+        with self.cond:
+            self.ensure_running()
+            self.wheel.add(timer)
+            if self.wake_tick is None or timer.tick < self.wake_tick:
+                self.cond.notify()
+        return timer
+
+    def ensure_running(self):
+        # Also restarts the thread in a forked worker process, where it does not exist
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='scheduler', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.wake_tick = self.wheel.next_tick()
+                now = time.monotonic()
+                if self.wake_tick is None:
+                    self.cond.wait()
+                    continue
+                deadline = self.wheel.start + self.wake_tick * self.wheel.resolution
+                if deadline > now:
+                    self.cond.wait(deadline - now)
+                    continue
+                self.wake_tick = -1
+                expired = self.wheel.advance(now)
+            for timer in expired:
+                self.fire(timer)
+
+    def fire(self, timer):
+        try:
+            timer.callback(*timer.args)
+        except Exception:
+            logging.exception(f"Scheduled callback {timer.callback!r} failed")
+        if timer.interval is None or timer.cancelled:
+            return
+        # Next run is based on the previous deadline, not on now
+        timer.deadline += timer.interval
+        now = time.monotonic()
+        if timer.deadline <= now:
+            missed = int((now - timer.deadline) // timer.interval) + 1
+            self.late_runs += missed
+            timer.deadline += missed * timer.interval
+        self.add(timer)
+
+
+scheduler = Scheduler()
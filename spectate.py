@@ -0,0 +1,101 @@
+"""Live match state for HTTP spectators (/state and /events).
+
+Spectators are not players: they never touch a room's client registry or
+outbound queues. A single thread samples every room at its own rate
+(normally lower than the players' update rate), and encodes a changed state
+once as JSON. The same bytes are returned by every /state request and queued
+on every /events (Server-Sent Events) connection watching that room.
+"""
+import json
+import threading
+import time
+
+from http_loop import EventChannel
+from protocol import STATE_FIELDS
+
+HEARTBEAT = b": ping\n\n"  # SSE comment, keeps idle connections and proxies alive
+
+
+class SpectatorFeed:
+    def __init__(self, rooms, rate=2.0, heartbeat=10.0):
+        self.rooms = rooms
+        self.interval = 1.0 / rate
+        self.heartbeat = heartbeat
+        self.snapshots = {}  # {room_id: (state tuple, version, JSON bytes)}
+        self.channels = {}  # {room_id: EventChannel}
+        self.lock = threading.Lock()
+        self.running = True
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def snapshot(self, room_id):
+        """Latest encoded state of a room, or None if there is no such room"""
+        entry = self.snapshots.get(room_id)
+        if entry is None:
+            room = self.rooms.rooms.get(room_id)
+            if room is None:
+                return None
+            entry = self.sample(room_id, room)
+        return entry[2]
+
+    def channel(self, room_id):
+        """SSE channel of a room, or None if there is no such room"""
+        with self.lock:
+            channel = self.channels.get(room_id)
+            if channel is None:
+                room = self.rooms.rooms.get(room_id)
+                if room is None:
+                    return None
+                channel = self.channels[room_id] = EventChannel()
+        if channel.last is None:
+            self.sample(room_id, self.rooms.rooms.get(room_id))
+        return channel
+
+    def run(self):
+        next_sample = time.monotonic()
+        next_heartbeat = next_sample + self.heartbeat
+        while self.running:
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.monotonic()
+            for room_id, room in list(self.rooms.rooms.items()):
+                self.sample(room_id, room)
+            self.forget_closed_rooms()
+            if time.monotonic() >= next_heartbeat:
+                next_heartbeat += self.heartbeat
+                for channel in list(self.channels.values()):
+                    channel.publish(HEARTBEAT, replay=False)
+
+    def sample(self, room_id, room):
+        """Encode the room's state if it changed since the last sample"""
+        if room is None:
+            return None
+        state = room.snapshot  # published by the room's actor, never mutated
+        with self.lock:
+            entry = self.snapshots.get(room_id)
+            if entry is not None and entry[0] == state:
+                return entry
+            version = entry[1] + 1 if entry else 1
+            message = {'room': room_id, 'version': version}
+            message.update(zip(STATE_FIELDS, state))
+            data = json.dumps(message).encode()
+            entry = self.snapshots[room_id] = (state, version, data)
+            channel = self.channels.get(room_id)
+            if channel is not None:
+                channel.publish(b"id: %d\nevent: state\ndata: %s\n\n" % (version, data))
+        return entry
+
+    def forget_closed_rooms(self):
+        with self.lock:
+            for room_id in [r for r in self.snapshots if r not in self.rooms.rooms]:
+                del self.snapshots[room_id]
+                channel = self.channels.get(room_id)
+                if channel is not None and not channel.subscribers:
+                    del self.channels[room_id]
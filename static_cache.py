@@ -0,0 +1,278 @@
+"""In-memory cache of the static files served by HttpServer.
+
+Files are cached by name, together with their response headers already
+encoded, and revalidated against the file's mtime and size at most once per
+check_interval. A hit within that window touches neither the disk nor the
+file system metadata. Bodies share a memory budget and the least recently
+used ones are evicted first; files bigger than max_entry are never cached
+and are streamed from disk instead (see StaticCache.open).
+
+Text bodies are compressed once when cached (gzip, plus brotli if the
+module is installed) and the variant is picked per request from
+Accept-Encoding; a changed file gets a new entry and so new variants.
+"""
+import gzip
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from metrics import metrics, STATIC_CACHE, STATIC_CACHE_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'text/html', 'text/plain'}
+# Preferred first when the client accepts several
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=9, mtime=0)}
+if brotli:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=11)
+
+_date_cache = [0, '']
+
+
+def http_date(timestamp=None):
+    """IMF-fixdate as used in Date / Last-Modified; the current one is formatted once per second"""
+    if timestamp is not None:
+        return formatdate(timestamp, usegmt=True)
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[:] = [now, formatdate(now, usegmt=True)]
+    return _date_cache[1]
+
+
+class Encoded:
+    """A compressed representation of a StaticFile"""
+    __slots__ = ('encoding', 'etag', 'body', 'headers', 'validators')
+
+    def __init__(self, entry, encoding, body):
+        self.encoding = encoding
+        self.etag = '{}-{}"'.format(entry.etag[:-1], encoding)
+        self.body = body
+        self.validators = ("ETag: {}\r\nLast-Modified: {}\r\nVary: Accept-Encoding\r\n"
+                           .format(self.etag, entry.last_modified).encode())
+        self.headers = ("Content-type: {}\r\nContent-Encoding: {}\r\nContent-Length: {}\r\n"
+                        .format(entry.content_type, encoding, len(body)).encode() + self.validators)
+
+
+class StaticFile:
+    __slots__ = ('name', 'path', 'size', 'mtime_ns', 'etag', 'last_modified', 'content_type',
+                 'headers', 'validators', 'body', 'variants', 'memory', 'checked_at')
+
+    def __init__(self, name, path, size, mtime_ns, content_type):
+        self.name = name
+        self.path = path  # None for a body that only exists in memory
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.etag = '"{:x}-{:x}"'.format(mtime_ns, size)
+        self.last_modified = http_date(mtime_ns / 1e9)
+        self.content_type = content_type
+        # Sent with a 304 as well as with the full response
+        vary = "Vary: Accept-Encoding\r\n" if content_type in COMPRESSIBLE else ""
+        self.validators = "ETag: {}\r\nLast-Modified: {}\r\n{}".format(self.etag, self.last_modified, vary).encode()
+        self.headers = ("Content-type: {}\r\nContent-Length: {}\r\nAccept-Ranges: bytes\r\n"
+                        .format(content_type, self.size).encode() + self.validators)
+        self.body = None  # None: not cached, read from disk by the caller
+        self.variants = {}  # {encoding: Encoded}
+        self.memory = 0  # bytes held by body and variants
+        self.checked_at = time.monotonic()
+
+    @classmethod
+    def from_bytes(cls, name, body, content_type):
+        """Entry for a fixed response body; its Last-Modified is the time it was created"""
+        entry = cls(name, None, len(body), time.time_ns(), content_type)
+        entry.set_body(body)
+        return entry
+
+    def set_body(self, body):
+        """Cache the body and its compressed variants (only those smaller than the original)"""
+        self.body = body
+        self.memory = len(body)
+        if self.content_type not in COMPRESSIBLE:
+            return
+        for encoding in ENCODINGS:
+            compressed = COMPRESSORS[encoding](body)
+            if len(compressed) < len(body):
+                self.variants[encoding] = Encoded(self, encoding, compressed)
+                self.memory += len(compressed)
+
+    def negotiate(self, accept_encoding):
+        """Encoded variant acceptable to the client, None for the original"""
+        if not self.variants or not accept_encoding:
+            return None
+        weights = {}
+        for item in accept_encoding.split(','):
+            coding, _, params = item.partition(';')
+            weight = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    weight = float(params[2:])
+                except ValueError:
+                    weight = 0.0
+            weights[coding.strip().lower()] = weight
+        for encoding in ENCODINGS:
+            if encoding in self.variants and weights.get(encoding, weights.get('*', 0.0)) > 0:
+                return self.variants[encoding]
+        return None
+
+    def matches(self, st):
+        return st.st_mtime_ns == self.mtime_ns and st.st_size == self.size
+
+    def not_modified(self, if_none_match=None, if_modified_since=None, etag=None):
+        """Conditional GET: If-None-Match wins over If-Modified-Since.
+
+        etag is the tag of the representation being sent (a variant's), default the file's.
+        """
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or (etag or self.etag) in tags
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError):
+                return False
+            return self.mtime_ns // 1_000_000_000 <= since
+        return False
+
+    def if_range(self, value):
+        """Whether a Range request with this If-Range header may be answered with a part"""
+        if value is None:
+            return True
+        if value.startswith('"'):
+            return value == self.etag
+        return value == self.last_modified
+
+
+def parse_range(value, size, max_ranges=16):
+    """Range header as sorted, merged [(first, last)] byte positions.
+
+    [] if no range is satisfiable (416), None if the header should be
+    ignored and the whole file sent.
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for item in spec.split(','):
+        first, sep, last = item.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first == '':
+                # Suffix range: the last N bytes
+                count = int(last)
+                if count > 0 and size > 0:
+                    ranges.append((max(0, size - count), size - 1))
+                continue
+            first, last = int(first), int(last) if last else size - 1
+        except ValueError:
+            return None
+        if first >= size:
+            continue
+        if last < first:
+            return None
+        ranges.append((first, min(last, size - 1)))
+    if len(ranges) > max_ranges:
+        return None
+    # Overlapping or adjacent ranges are sent once
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class StaticCache:
+    def __init__(self, root='./', types=None, budget=32 * 1024 * 1024, max_entry=None, check_interval=1.0):
+        self.root = root
+        self.types = types if types is not None else {}  # {extension: content type}
+        self.budget = budget
+        self.max_entry = max_entry if max_entry is not None else budget // 4
+        self.check_interval = check_interval
+        self.entries = OrderedDict()  # {name: StaticFile}, least recently used first
+        self.used = 0  # bytes of cached bodies
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """StaticFile for a top-level file with a known type, or None"""
+        if not name or '/' in name or '\\' in name or name.startswith('.'):
+            return None
+        content_type = self.types.get(os.path.splitext(name)[1])
+        if content_type is None:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self.entries.move_to_end(name)
+                if now - entry.checked_at < self.check_interval:
+                    metrics.inc(STATIC_CACHE['hit'])
+                    return entry
+        path = os.path.join(self.root, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.discard(name)
+            return None
+        if entry is not None and entry.matches(st):
+            entry.checked_at = now
+            metrics.inc(STATIC_CACHE['revalidated'])
+            return entry
+        metrics.inc(STATIC_CACHE['miss'])
+        return self.load(name, path, content_type)
+
+    def load(self, name, path, content_type):
+        # Retry if the file changes while it is being read, so the cached
+        # body always matches its ETag and Content-Length
+        for attempt in range(3):
+            try:
+                with open(path, 'rb') as fp:
+                    st = os.fstat(fp.fileno())
+                    if not stat.S_ISREG(st.st_mode):
+                        return None
+                    entry = StaticFile(name, path, st.st_size, st.st_mtime_ns, content_type)
+                    if st.st_size > self.max_entry:
+                        self.discard(name)
+                        return entry
+                    body = fp.read()
+                    if len(body) == st.st_size and entry.matches(os.fstat(fp.fileno())):
+                        break
+            except OSError:
+                self.discard(name)
+                return None
+        else:
+            return None
+        entry.set_body(body)
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.used -= old.memory
+            self.entries[name] = entry
+            self.used += entry.memory
+            while self.used > self.budget and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.used -= evicted.memory
+            metrics.set(STATIC_CACHE_BYTES, self.used)
+        return entry
+
+    def open(self, entry):
+        """Open an uncached file for streaming; the entry is rebuilt if the file changed since"""
+        fp = open(entry.path, 'rb')
+        st = os.fstat(fp.fileno())
+        if not entry.matches(st):
+            entry = StaticFile(entry.name, entry.path, st.st_size, st.st_mtime_ns, entry.content_type)
+        return fp, entry
+
+    def discard(self, name):
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.used -= old.memory
+                metrics.set(STATIC_CACHE_BYTES, self.used)
@@ -0,0 +1,188 @@
+"""Match history and player statistics in SQLite, written behind the game.
+
+    --stats-db stats.db       enable; /leaderboard and /matches read it
+
+A room's actor hands every finished match to stats.submit(): a deque append,
+nothing else. The writer thread collects what arrived during the last
+flush_interval and inserts it in one transaction, so the game never waits on
+the disk and a burst of rounds costs one commit.
+
+HTTP requests never query the database either. StatsCache keeps the
+leaderboard totals and the latest matches in memory, as the JSON bytes
+served to every request. It catches up incrementally: only matches with an
+id above the last one it has seen are read and added to the totals, at most
+once per refresh interval, and only then is the JSON rebuilt. That also picks
+up matches written by other worker processes sharing the same file.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from writebehind import WriteBehind
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    winner TEXT NOT NULL,
+    final_position INTEGER NOT NULL,
+    presses INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    player TEXT NOT NULL,
+    team TEXT NOT NULL,
+    presses INTEGER NOT NULL,
+    won INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS match_players_match ON match_players(match_id);
+"""
+RECENT_MATCHES = 50  # served by /matches
+LEADERBOARD_SIZE = 20
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")  # readers do not block the writer (or other processes)
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def insert_match(db, match):
+    cursor = db.execute(
+        "INSERT INTO matches (room, started, duration, winner, final_position, presses) VALUES (?, ?, ?, ?, ?, ?)",
+        (match['room'], match['started'], match['duration'], match['winner'], match['final_position'],
+         sum(p['presses'] for p in match['players'])))
+    db.executemany(
+        "INSERT INTO match_players (match_id, player, team, presses, won) VALUES (?, ?, ?, ?, ?)",
+        [(cursor.lastrowid, p['player'], p['team'], p['presses'], p['won']) for p in match['players']])
+
+
+class StatsWriter(WriteBehind):
+    """Write-behind queue of finished matches"""
+
+    def __init__(self, flush_interval=1.0, max_pending=10000):
+        super().__init__('stats', flush_interval)
+        # queue: (database path, match dict from TugOfWarGameServer.match_result)
+        self.max_pending = max_pending
+        self.databases = {}  # {path: connection}, used by the writer thread only
+        self.written = 0
+        self.dropped = 0
+        self.on_commit = None  # called on the writer thread after each batch (StatsCache.invalidate)
+
+    def submit(self, path, match):
+        """Queue a finished match for path's database; never blocks"""
+        if len(self.queue) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.enqueue((path, match))
+
+    def forked(self):
+        super().forked()
+        self.databases = {}  # SQLite connections must not be used across fork()
+
+    def finish(self):
+        for db in self.databases.values():
+            db.close()
+        self.databases.clear()
+
+    def write_pending(self):
+        batches = {}
+        while self.queue:
+            path, match = self.queue.popleft()
+            batches.setdefault(path, []).append(match)
+        for path, batch in batches.items():
+            try:
+                db = self.databases.get(path)
+                if db is None:
+                    db = self.databases[path] = connect(path)
+                with db:
+                    for match in batch:
+                        insert_match(db, match)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not store {len(batch)} match(es) in {path}: {e}")
+                continue
+            self.written += len(batch)
+            if self.on_commit is not None:
+                self.on_commit()
+
+
+class StatsCache:
+    """/leaderboard and /matches, kept in memory and updated from new rows only"""
+
+    def __init__(self, path, refresh=1.0):
+        self.path = path
+        self.refresh = refresh  # seconds between checks for matches written elsewhere
+        self.db = None
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.checked = 0.0
+        self.dirty = True  # new rows may be waiting
+        self.players = {}  # {player: [matches, wins, presses]}
+        self.recent = deque(maxlen=RECENT_MATCHES)  # newest last
+        self.pages = {}  # {'/leaderboard' | '/matches': JSON bytes}, emptied when rows arrive
+
+    def invalidate(self):
+        """New matches were committed (from this process's writer)"""
+        self.dirty = True
+
+    def page(self, path):
+        """JSON body for /leaderboard or /matches"""
+        with self.lock:
+            now = time.monotonic()
+            if self.dirty or now - self.checked >= self.refresh:
+                self.dirty = False
+                self.checked = now
+                self.catch_up()
+            body = self.pages.get(path)
+            if body is None:
+                body = self.pages[path] = self.render(path)
+            return body
+
+    def catch_up(self):
+        try:
+            if self.db is None:
+                self.db = connect(self.path)
+            matches = self.db.execute(
+                "SELECT id, room, started, duration, winner, final_position, presses FROM matches "
+                "WHERE id > ? ORDER BY id", (self.last_id,)).fetchall()
+            if not matches:
+                return
+            # Bounded by the last match read, in case another one was committed in between
+            players = self.db.execute(
+                "SELECT match_id, player, team, presses, won FROM match_players WHERE match_id > ? AND match_id <= ?",
+                (self.last_id, matches[-1][0])).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read match stats from {self.path}: {e}")
+            return
+        by_match = {}
+        for match_id, player, team, presses, won in players:
+            by_match.setdefault(match_id, []).append({'player': player, 'team': team, 'presses': presses})
+            totals = self.players.setdefault(player, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += won
+            totals[2] += presses
+        for match_id, room, started, duration, winner, position, presses in matches:
+            self.recent.append({'id': match_id, 'room': room, 'started': started, 'duration': round(duration, 1),
+                                'winner': winner, 'final_position': position, 'presses': presses,
+                                'players': by_match.get(match_id, [])})
+        self.last_id = matches[-1][0]
+        self.pages = {}
+
+    def render(self, path):
+        if path == '/leaderboard':
+            ranked = sorted(self.players.items(), key=lambda item: (-item[1][1], -item[1][2], item[0]))
+            body = [{'player': player, 'matches': m, 'wins': w, 'presses': p}
+                    for player, (m, w, p) in ranked[:LEADERBOARD_SIZE]]
+        else:
+            body = list(reversed(self.recent))
+        return json.dumps(body).encode()
+
+
+stats = StatsWriter()
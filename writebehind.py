@@ -0,0 +1,64 @@
+"""Background writer thread shared by the match journal and the stats store.
+
+Producers (room actors) only append to a deque and never wait on the disk.
+The thread wakes every flush_interval and hands everything queued so far to
+write_pending(). It is started lazily on the first enqueue(), which also
+restarts it in a forked worker process, where the parent's thread does not
+exist. A child first drops what it inherited (queued items, open files or
+connections): those still belong to the parent, which writes them itself.
+"""
+import os
+import threading
+from collections import deque
+
+
+class WriteBehind:
+    def __init__(self, name, flush_interval):
+        self.name = name
+        self.flush_interval = flush_interval
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()  # thread start only
+        self.running = True
+        self.pid = os.getpid()  # process owning the queue and the thread
+
+    def enqueue(self, item):
+        if self.pid != os.getpid():
+            self.forked()
+        self.queue.append(item)
+        if self.running and (self.thread is None or not self.thread.is_alive()):
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.write_pending()
+        self.write_pending()
+        self.finish()
+
+    def close(self):
+        """Write out everything queued so far and stop (server shutdown)"""
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(5.0)
+
+    def forked(self):
+        """First use in a forked child: start over without the parent's state"""
+        self.pid = os.getpid()
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def write_pending(self):
+        """Write and remove what is in self.queue; runs on the writer thread"""
+        raise NotImplementedError
+
+    def finish(self):
+        """Release files or connections once the thread stops"""